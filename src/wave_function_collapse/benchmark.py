@@ -0,0 +1,315 @@
+from __future__ import annotations
+from functools import partial
+from typing import Callable, NamedTuple, Optional, Sequence
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from .generate import RULESETS, compile_ruleset
+from .propagator import Contradiction
+from .rules import CompiledRules, compile_rules
+from .sampling import WeightedSampler
+from .simpler_with_overlapping import SampleAnalyzer
+from .solver import BacktrackLimits, Solver
+
+
+# (rows, cols) per profile, the full profile goes up to 1024x1024 and takes a while
+SIZES: dict[str, tuple[tuple[int, int], ...]] = {
+    "quick": ((32, 48), (128, 128)),
+    "full": ((32, 48), (128, 128), (256, 256), (512, 512), (1024, 1024)),
+}
+# tile counts of the generated rulesets
+TILE_COUNTS: tuple[int, ...] = (3, 10, 40)
+
+# results more than this much slower than the baseline are flagged
+DEFAULT_THRESHOLD: float = 0.2
+DEFAULT_BASELINE: str = os.path.join("benchmarks", "baseline.json")
+
+
+class BenchmarkResult(NamedTuple):
+    # e.g. "solve/simpler/128x128"
+    name: str
+    cells: int
+    seconds: float
+    cells_per_sec: float
+    # peak traced allocations of one run, measured in a separate run since tracing slows everything down
+    peak_bytes: int
+    # share of runs that ended in a contradiction (0 for benchmarks that can't contradict)
+    contradiction_rate: float
+
+
+def random_rules(tile_count: int, seed: int = 0, density: float = 0.5) -> CompiledRules:
+    # symmetric random ruleset: if b may sit right of a then a may sit left of b (same for up/down)
+    # every tile may sit next to itself, so there is always some way out of a corner
+    rng = random.Random(seed)
+    opposite = (1, 0, 3, 2)
+    connections: set[tuple[int, int, int]] = set()
+    for a in range(tile_count):
+        for direction in range(4):
+            connections.add((a, a, direction))
+        for b in range(tile_count):
+            for direction in (0, 2):
+                if rng.random() < density:
+                    connections.add((a, b, direction))
+                    connections.add((b, a, opposite[direction]))
+
+    weights = [rng.uniform(0.5, 2.0) for _ in range(tile_count)]
+    return compile_rules(list(range(tile_count)), weights, connections)
+
+
+def measure(name: str, cells: int, runs: int, run: Callable[[int], bool]) -> BenchmarkResult:
+    # run(n) does the n-th run and returns False on a contradiction
+    contradictions = 0
+    start = time.perf_counter()
+    for n in range(runs):
+        if not run(n):
+            contradictions += 1
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        run(0)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return BenchmarkResult(name, cells * runs, seconds, cells * runs / seconds, peak, contradictions / runs)
+
+
+def runs_for(cells: int) -> int:
+    # enough runs to be measurable on small maps, one on the large ones
+    return max(1, min(20, 50_000 // cells))
+
+
+def bench_solve(name: str, rules: CompiledRules, rows: int, cols: int, backtracking: Optional[BacktrackLimits]) -> BenchmarkResult:
+    def run(n: int) -> bool:
+        return Solver(rules, rows, cols, random.Random(n), backtracking).run()
+
+    return measure(f"solve/{name}/{rows}x{cols}", rows * cols, runs_for(rows * cols), run)
+
+
+def bench_propagate(name: str, rules: CompiledRules, rows: int, cols: int) -> BenchmarkResult:
+    # only the time spent propagating is counted, the solve itself is driven by hand
+    # times[n] is the propagation time of the n-th call to run(), the last one being measure()'s traced run
+    times: list[float] = []
+
+    def run(n: int) -> bool:
+        solver = Solver(rules, rows, cols, random.Random(n))
+        perf_counter = time.perf_counter
+        elapsed = 0.0
+        try:
+            while (i := solver.find_lowest_entropy()) is not None:
+                solver.collapse(i)
+                start = perf_counter()
+                solver.propagate([i])
+                elapsed += perf_counter() - start
+        except Contradiction:
+            return False
+        finally:
+            times.append(elapsed)
+        return True
+
+    runs = runs_for(rows * cols)
+    result = measure(f"propagate/{name}/{rows}x{cols}", rows * cols, runs, run)
+    seconds = sum(times[:runs])
+    return result._replace(seconds=seconds, cells_per_sec=result.cells / seconds)
+
+
+def bench_analyze(rows: int, cols: int) -> BenchmarkResult:
+    rng = random.Random(0)
+    sample = [bytes(rng.choice((0, 1, 2)) for _ in range(cols)) for _ in range(rows)]
+
+    def run(n: int) -> bool:
+        analyzer = SampleAnalyzer()
+        analyzer.feed_rows(sample)
+        analyzer.connections()
+        return True
+
+    return measure(f"analyze/{rows}x{cols}", rows * cols, runs_for(rows * cols), run)
+
+
+def bench_sample(tile_count: int) -> BenchmarkResult:
+    # weighted picks from a few recurring domains of about half the tiles, counted as one cell per pick
+    rng = random.Random(0)
+    weights = [rng.uniform(0.5, 2.0) for _ in range(tile_count)]
+    domains = [((1 << tile_count) - 1) & ~rng.getrandbits(tile_count) or 1 for _ in range(32)]
+    picks = 10_000
+
+    def run(n: int) -> bool:
+        sampler = WeightedSampler(weights)
+        pick_rng = random.Random(n)
+        for k in range(picks):
+            sampler.choose(domains[k % len(domains)], pick_rng)
+        return True
+
+    return measure(f"sample/{tile_count}", picks, 5, run)
+
+
+def bench_render(rows: int, cols: int) -> BenchmarkResult:
+    # the terminal renderer, into a buffer instead of the terminal
+    from .simpler import PALETTE, Tiles
+    from .terminal import TerminalRenderer
+
+    rng = random.Random(0)
+    tilemap = [rng.choice((Tiles.SEA, Tiles.COAST, Tiles.LAND)) for _ in range(rows * cols)]
+
+    def run(n: int) -> bool:
+        TerminalRenderer(rows, cols, PALETTE, out=io.BytesIO()).draw(tilemap)
+        return True
+
+    return measure(f"render/terminal/{rows}x{cols}", rows * cols, runs_for(rows * cols), run)
+
+
+def bench_viewer(rows: int, cols: int) -> BenchmarkResult:
+    # the viewer's per frame dirty cell update (solver.take_changed() -> set_tile() -> the cells in view to redraw),
+    # without the raylib draw calls themselves. only the update is timed, the solve is driven by hand in between
+    # times[n] is the update time of the n-th call to run(), the last one being measure()'s traced run
+    from .ruleset import builtin_rules
+    from .tilemap import DirtyTiles
+
+    rules = builtin_rules("coast")
+    # collapses per frame, and the cells in view of a 1280x720 window of 16x16 tiles
+    frame_collapses = 64
+    view = (0, 0, min(rows, 45) - 1, min(cols, 80) - 1)
+    times: list[float] = []
+
+    def run(n: int) -> bool:
+        solver = Solver(rules, rows, cols, random.Random(n), BacktrackLimits())
+        solver.track_changes()
+        tilemap = DirtyTiles(rows, cols)
+        perf_counter = time.perf_counter
+        elapsed = 0.0
+        done = False
+        try:
+            while not done:
+                for _ in range(frame_collapses):
+                    if solver.collapse_next() is None:
+                        done = True
+                        break
+
+                start = perf_counter()
+                tile = solver.wave.tile
+                for i in solver.take_changed():
+                    tilemap.set_tile(i, tile(i))
+                tilemap.take_dirty(*view)
+                elapsed += perf_counter() - start
+        except Contradiction:
+            return False
+        finally:
+            times.append(elapsed)
+        return True
+
+    runs = runs_for(rows * cols)
+    result = measure(f"render/viewer/{rows}x{cols}", rows * cols, runs, run)
+    seconds = sum(times[:runs])
+    return result._replace(seconds=seconds, cells_per_sec=result.cells / seconds)
+
+
+def run_suite(profile: str, only: Optional[str] = None) -> list[BenchmarkResult]:
+    benchmarks: list[tuple[str, Callable[[], BenchmarkResult]]] = []
+
+    # the rulesets from data/ are tilesets with corners, they need backtracking to finish big maps
+    rulesets: list[tuple[str, CompiledRules, Optional[BacktrackLimits]]] = [
+        (name, compile_ruleset(name), None if name in ("simpler", "overlapping") else BacktrackLimits())
+        for name in RULESETS
+    ]
+    for tile_count in TILE_COUNTS:
+        rulesets.append((f"random{tile_count}", random_rules(tile_count), BacktrackLimits()))
+
+    for rows, cols in SIZES[profile]:
+        for name, rules, backtracking in rulesets:
+            benchmarks.append((f"solve/{name}/{rows}x{cols}", partial(bench_solve, name, rules, rows, cols, backtracking)))
+        benchmarks.append((f"propagate/simpler/{rows}x{cols}", partial(bench_propagate, "simpler", rulesets[0][1], rows, cols)))
+        benchmarks.append((f"analyze/{rows}x{cols}", partial(bench_analyze, rows, cols)))
+        benchmarks.append((f"render/terminal/{rows}x{cols}", partial(bench_render, rows, cols)))
+        benchmarks.append((f"render/viewer/{rows}x{cols}", partial(bench_viewer, rows, cols)))
+    for tile_count in TILE_COUNTS:
+        benchmarks.append((f"sample/{tile_count}", partial(bench_sample, tile_count)))
+
+    results: list[BenchmarkResult] = []
+    for name, bench in benchmarks:
+        if only is not None and only not in name:
+            continue
+        result = bench()
+        print(
+            f"{result.name:<32} {result.cells_per_sec:>12.0f} cells/sec {result.peak_bytes / 1e6:>9.2f} MB peak "
+            f"{result.contradiction_rate:>6.1%} contradictions",
+            file=sys.stderr,
+        )
+        results.append(result)
+
+    return results
+
+
+def compare(results: Sequence[BenchmarkResult], baseline: dict[str, dict[str, float]], threshold: float) -> list[str]:
+    # names of the benchmarks that got slower than the baseline by more than threshold
+    regressions: list[str] = []
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None:
+            continue
+        if result.cells_per_sec < base["cells_per_sec"] * (1.0 - threshold):
+            regressions.append(result.name)
+            print(
+                f"REGRESSION {result.name}: {result.cells_per_sec:.0f} cells/sec vs {base['cells_per_sec']:.0f} baseline",
+                file=sys.stderr,
+            )
+
+    return regressions
+
+
+def to_json(results: Sequence[BenchmarkResult]) -> dict[str, object]:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "results": {result.name: result._asdict() for result in results},
+    }
+
+
+# main entry
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the solve, propagate, analyze and render hot paths.")
+    parser.add_argument("--profile", choices=SIZES, default="quick", help="map sizes to run, full goes up to 1024x1024")
+    parser.add_argument("--only", default=None, help="only run benchmarks whose name contains this")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file (stdout by default)")
+    parser.add_argument("--baseline", default=None, help=f"compare against this results file (defaults to {DEFAULT_BASELINE} if it exists)")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to the baseline file instead of comparing")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.profile, args.only)
+    report = json.dumps(to_json(results), indent=2)
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+    baseline_path = args.baseline if args.baseline is not None else DEFAULT_BASELINE
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(baseline_path) or ".", exist_ok=True)
+        with open(baseline_path, "w") as file:
+            file.write(report + "\n")
+        print(f"Saved baseline to {baseline_path}", file=sys.stderr)
+        return
+
+    if not os.path.exists(baseline_path):
+        return
+
+    with open(baseline_path) as file:
+        baseline = json.load(file)["results"]
+    if compare(results, baseline, args.threshold):
+        sys.exit(1)
+    print(f"No regressions against {baseline_path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
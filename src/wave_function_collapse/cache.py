@@ -0,0 +1,132 @@
+from __future__ import annotations
+from typing import Callable, Optional
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+
+from .rules import CompiledRules
+
+
+# compiled rules file, everything little endian:
+#   header: magic, format version, tile count, direction count, 64-bit words per mask
+#   tile values (int64 each), weights (float64 each)
+#   masks: allowed[direction][tile], `words` 64-bit words each
+MAGIC: bytes = b"WFCR"
+# bumped whenever the layout or what the rulesets compile to changes, so older cache entries are never read
+FORMAT_VERSION: int = 2
+HEADER = struct.Struct("<4sHxxIII")
+
+
+def cache_dir() -> str:
+    # $WFC_CACHE_DIR, or wave_function_collapse in the user's cache dir
+    directory = os.environ.get("WFC_CACHE_DIR")
+    if directory:
+        return directory
+
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "wave_function_collapse")
+
+
+def source_key(*parts: object) -> str:
+    # content hash of whatever the rules are built from (a sample, a connection list, ...)
+    # parts are hashed through repr(), so they should be in a stable order (sorted sets, lists, bytes, ...)
+    digest = hashlib.sha256(f"{MAGIC!r}:{FORMAT_VERSION}".encode())
+    for part in parts:
+        digest.update(repr(part).encode())
+        digest.update(b"\0")
+
+    return digest.hexdigest()
+
+
+def dump_rules(rules: CompiledRules) -> bytes:
+    tile_count = len(rules.tiles)
+    directions = len(rules.allowed)
+    words = (tile_count + 63) // 64
+    mask_size = words * 8
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, tile_count, directions, words)
+    tiles = struct.pack(f"<{tile_count}q", *rules.tiles)
+    weights = struct.pack(f"<{tile_count}d", *rules.weights)
+    masks = b"".join(mask.to_bytes(mask_size, "little") for allowed in rules.allowed for mask in allowed)
+    return header + tiles + weights + masks
+
+
+def load_rules(buffer: bytes | bytearray | memoryview | mmap.mmap) -> CompiledRules:
+    # raises ValueError if the buffer isn't a compiled rules file of this version
+    # the view is released even on errors, an mmap can't be closed while a view of it is still around
+    with memoryview(buffer) as view:
+        return _load_rules(view)
+
+
+def _load_rules(view: memoryview) -> CompiledRules:
+    if len(view) < HEADER.size:
+        raise ValueError("truncated compiled rules")
+
+    magic, version, tile_count, directions, words = HEADER.unpack_from(view)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"not a version {FORMAT_VERSION} compiled rules file")
+
+    mask_size = words * 8
+    tiles_at = HEADER.size
+    weights_at = tiles_at + tile_count * 8
+    masks_at = weights_at + tile_count * 8
+    if len(view) != masks_at + directions * tile_count * mask_size:
+        raise ValueError("truncated compiled rules")
+
+    tiles = struct.unpack_from(f"<{tile_count}q", view, tiles_at)
+    weights = struct.unpack_from(f"<{tile_count}d", view, weights_at)
+    allowed: list[tuple[int, ...]] = []
+    at = masks_at
+    for _ in range(directions):
+        by_tile: list[int] = []
+        for _ in range(tile_count):
+            by_tile.append(int.from_bytes(view[at:at + mask_size], "little"))
+            at += mask_size
+        allowed.append(tuple(by_tile))
+
+    return CompiledRules(tiles=tiles, weights=weights, allowed=tuple(allowed))
+
+
+def write_rules(path: str, rules: CompiledRules) -> None:
+    # written next to the destination and renamed over it, so readers never see half a file
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(dump_rules(rules))
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def read_rules(path: str) -> CompiledRules:
+    # memory mapped, so only the pages that are read get loaded
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            raise ValueError("empty compiled rules file")
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return load_rules(mapped)
+
+
+def cached_rules(key: str, build: Callable[[], CompiledRules], directory: Optional[str] = None) -> CompiledRules:
+    # compiled rules for `key` (see source_key()) from the cache, only calling build() on a miss
+    # a changed sample or ruleset hashes to a different key, so stale entries are never read
+    path = os.path.join(directory if directory is not None else cache_dir(), f"{key}.rules")
+    try:
+        return read_rules(path)
+    except (OSError, ValueError):
+        pass
+
+    rules = build()
+    try:
+        write_rules(path, rules)
+    except OSError:
+        # a read-only or missing cache dir just means no caching
+        pass
+
+    return rules
@@ -0,0 +1,192 @@
+from __future__ import annotations
+from array import array
+from collections import OrderedDict
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+import os
+import random
+import tempfile
+import time
+
+from .propagator import Contradiction
+from .rules import CompiledRules
+from .solver import BacktrackLimits, Solver
+from .topology import border_constraints
+from .wave import UNSET
+
+
+class Chunk(NamedTuple):
+    # chunk coordinates, chunk (cx, cy) covers rows cy * rows .. (cy + 1) * rows - 1 of the world (same for columns)
+    cx: int
+    cy: int
+    rows: int
+    cols: int
+    # tile values, row by row
+    tiles: list[int]
+
+
+# an unbounded world made of fixed size chunks, each one solved on demand by its own Solver
+# a new chunk's border cells are constrained against the border tiles of whichever neighboring chunks already
+# exist, so tiles on both sides of a seam always agree with the rules. only `cache_size` chunks are kept in memory,
+# every chunk is written to `directory` once solved and read back from there after it has been evicted.
+class ChunkedWorld:
+    def __init__(
+            self,
+            rules: CompiledRules,
+            chunk_rows: int,
+            chunk_cols: int,
+            seed: int = 0,
+            cache_size: int = 64,
+            directory: Optional[str] = None,
+            backtracking: Optional[BacktrackLimits] = BacktrackLimits()
+        ) -> None:
+        self.rules = rules
+        self.chunk_rows = chunk_rows
+        self.chunk_cols = chunk_cols
+        self.seed = seed
+        self.cache_size = cache_size
+        # a chunk solved against fixed borders can't be restarted from scratch by picking other borders,
+        # so backtracking is on by default to get through the harder ones
+        self.backtracking = backtracking
+
+        # a temporary directory is cleaned up by close(), a given one is left alone
+        self._tempdir: Optional[tempfile.TemporaryDirectory[str]] = None
+        if directory is None:
+            self._tempdir = tempfile.TemporaryDirectory(prefix="wfc-chunks-")
+            directory = self._tempdir.name
+        self.directory: str = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+        # (cx, cy) -> tile indices, least recently used first
+        self._cache: OrderedDict[tuple[int, int], array[int]] = OrderedDict()
+
+    def close(self) -> None:
+        self._cache.clear()
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+            self._tempdir = None
+
+    def __enter__(self) -> ChunkedWorld:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def _path(self, cx: int, cy: int) -> str:
+        return os.path.join(self.directory, f"{cx}_{cy}.chunk")
+
+    def exists(self, cx: int, cy: int) -> bool:
+        return (cx, cy) in self._cache or os.path.exists(self._path(cx, cy))
+
+    def _cached(self, key: tuple[int, int], indices: array[int]) -> None:
+        self._cache[key] = indices
+        self._cache.move_to_end(key)
+        # chunks are already on disk, so evicting one is just dropping it
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _load(self, cx: int, cy: int) -> Optional[array[int]]:
+        indices = self._cache.get((cx, cy))
+        if indices is not None:
+            self._cache.move_to_end((cx, cy))
+            return indices
+
+        try:
+            with open(self._path(cx, cy), "rb") as file:
+                indices = array("H")
+                indices.frombytes(file.read())
+        except FileNotFoundError:
+            return None
+
+        self._cached((cx, cy), indices)
+        return indices
+
+    def _border_constraints(self, cx: int, cy: int) -> list[tuple[int, int]]:
+        # (cell, mask) for every border cell that touches an existing chunk, the mask being the tiles
+        # allowed next to the neighbor's tile on the other side of the seam
+        rows, cols = self.chunk_rows, self.chunk_cols
+        # the neighboring chunks by their offset, None where there is none yet
+        neighbors = {(dx, dy): self._load(cx + dx, cy + dy) for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0))}
+
+        def outside(row: int, col: int) -> int:
+            # cells just outside this chunk, in the chunk's own coordinates
+            neighbor = neighbors.get((-1 if col < 0 else col // cols, -1 if row < 0 else row // rows))
+            if neighbor is None:
+                return UNSET
+            return neighbor[row % rows * cols + col % cols]
+
+        return border_constraints(self.rules.allowed, 0, 0, rows, cols, outside)
+
+    def _solve(self, cx: int, cy: int) -> array[int]:
+        # every chunk gets its own random.Random seeded from the world seed and its coordinates,
+        # so a chunk only depends on the seed and on the neighbors that existed when it was solved
+        rng = random.Random(f"{self.seed}:{cx}:{cy}")
+        solver = Solver(self.rules, self.chunk_rows, self.chunk_cols, rng, self.backtracking)
+        solver.constrain(self._border_constraints(cx, cy))
+        if not solver.run():
+            assert solver.contradiction is not None
+            raise Contradiction(solver.contradiction)
+
+        wave = solver.wave
+        indices = array("H", [wave.index(i) for i in range(wave.size)])
+        with open(self._path(cx, cy), "wb") as file:
+            file.write(indices.tobytes())
+
+        return indices
+
+    def chunk(self, cx: int, cy: int) -> Chunk:
+        # solves the chunk if it doesn't exist yet, raises Contradiction if it couldn't be solved
+        indices = self._load(cx, cy)
+        if indices is None:
+            indices = self._solve(cx, cy)
+            self._cached((cx, cy), indices)
+
+        tiles = self.rules.tiles
+        return Chunk(cx, cy, self.chunk_rows, self.chunk_cols, [tiles[t] for t in indices])
+
+    def chunks(self, coords: Iterable[tuple[int, int]]) -> Iterator[Chunk]:
+        # yields each chunk as soon as it's done, coords can be an endless generator (see spiral())
+        for cx, cy in coords:
+            yield self.chunk(cx, cy)
+
+    def tile(self, row: int, col: int) -> int:
+        # tile value at world coordinates, solving its chunk if needed
+        cy, chunk_row = divmod(row, self.chunk_rows)
+        cx, chunk_col = divmod(col, self.chunk_cols)
+        return self.chunk(cx, cy).tiles[chunk_row * self.chunk_cols + chunk_col]
+
+
+def spiral(cx: int = 0, cy: int = 0) -> Iterator[tuple[int, int]]:
+    # chunk coordinates spiraling out from (cx, cy) forever
+    yield cx, cy
+    ring = 1
+    while True:
+        x, y = cx - ring, cy - ring
+        for dx, dy in ((1, 0), (0, 1), (-1, 0), (0, -1)):
+            for _ in range(ring * 2):
+                x += dx
+                y += dy
+                yield x, y
+        ring += 1
+
+
+# main entry
+def main() -> None:
+    import itertools
+
+    from .simpler import CONNECTIONS, MAP_HEIGHT, MAP_WIDTH, WEIGHTS, compile_connections
+
+    chunk_count: int = 49
+    rules = compile_connections(CONNECTIONS, WEIGHTS)
+    with ChunkedWorld(rules, MAP_HEIGHT, MAP_WIDTH, cache_size=16) as world:
+        start = time.perf_counter()
+        for chunk in world.chunks(itertools.islice(spiral(), chunk_count)):
+            print(f"chunk ({chunk.cx}, {chunk.cy}) done")
+        elapsed = time.perf_counter() - start
+
+    cells = chunk_count * MAP_HEIGHT * MAP_WIDTH
+    print(f"Generated {chunk_count} chunks of {MAP_HEIGHT}x{MAP_WIDTH} in {elapsed:.2f}s ({cells / elapsed:.0f} cells/sec)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+from __future__ import annotations
+from enum import IntEnum
+from typing import Optional
+
+import heapq
+import random
+
+
+class Heuristic(IntEnum):
+    # number of possible tiles, ignores the weights
+    COUNT = 0
+    # Shannon entropy of the possible tiles' weights, cells that are left with one likely tile go first
+    SHANNON = 1
+
+
+# lazy-deletion min-heap of cells keyed by entropy
+# instead of scanning the whole map every step, a cell is (re)pushed whenever its entropy changes.
+# old entries are left in the heap and skipped when popped, since their entropy no longer matches the cell's current entropy
+class EntropyHeap:
+    def __init__(self, size: int, rng: Optional[random.Random] = None) -> None:
+        self._rng: random.Random = rng if rng is not None else random.Random()
+        # current entropy of each cell still waiting to be collapsed, None once it's popped or removed
+        self._entropy: list[Optional[float]] = [None] * size
+        # (entropy, random tie-breaker, cell index)
+        self._heap: list[tuple[float, float, int]] = []
+        # cells waiting to be collapsed (the heap itself also holds stale entries)
+        self._waiting: int = 0
+
+    def __len__(self) -> int:
+        return self._waiting
+
+    def fill(self, entropy: float) -> None:
+        # every cell starts with the same entropy, so build the heap in one go instead of pushing cell by cell
+        rand = self._rng.random
+        self._entropy = [entropy] * len(self._entropy)
+        self._waiting = len(self._entropy)
+        self._heap = [(entropy, rand(), i) for i in range(len(self._entropy))]
+        heapq.heapify(self._heap)
+
+    def push(self, i: int, entropy: float) -> None:
+        if self._entropy[i] is None:
+            self._waiting += 1
+        self._entropy[i] = entropy
+        heapq.heappush(self._heap, (entropy, self._rng.random(), i))
+
+    def remove(self, i: int) -> None:
+        # the heap entries for this cell become stale and are dropped when they reach the top
+        if self._entropy[i] is not None:
+            self._waiting -= 1
+            self._entropy[i] = None
+
+    def pop(self) -> Optional[int]:
+        # random tie-breaker means equal entropies come out in a random order, like random.choice() over the lowest set
+        heap = self._heap
+        entropies = self._entropy
+        while heap:
+            entropy, _, i = heapq.heappop(heap)
+            if entropies[i] == entropy:
+                entropies[i] = None
+                self._waiting -= 1
+                return i
+
+        return None
@@ -0,0 +1,312 @@
+from __future__ import annotations
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, Mapping, NamedTuple, Optional, Sequence, TextIO
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from . import simpler, simpler_with_overlapping
+from .cache import cached_rules, source_key
+from .rules import CompiledRules
+from .ruleset import builtin_rules, builtin_rulesets
+from .entropy import Heuristic
+from .solver import BacktrackLimits, Solver
+from .topology import grid
+
+
+# the two rulesets built in code, plus the ones loaded from data/ (see ruleset.py)
+RULESETS: tuple[str, ...] = ("simpler", "overlapping", *builtin_rulesets())
+
+
+class MapJob(NamedTuple):
+    seed: int
+    rows: int
+    cols: int
+    # backtrack on contradictions instead of giving up, None to give up
+    backtracking: Optional[BacktrackLimits] = None
+    heuristic: Heuristic = Heuristic.COUNT
+    # wrap the edges around, for maps that tile seamlessly
+    periodic: bool = False
+
+
+class MapResult(NamedTuple):
+    seed: int
+    rows: int
+    cols: int
+    # tile values, UNSET for cells that never got a tile
+    tiles: list[int]
+    # cell that ran out of tiles, if any
+    contradiction: Optional[int]
+    # seconds spent solving
+    elapsed: float
+    backtracks: int = 0
+    restarts: int = 0
+
+
+def compile_ruleset(name: str, use_cache: bool = True) -> CompiledRules:
+    # compiled rules are cached on disk (see cache.py), keyed by a hash of the connections or the sample they come from
+    build: Callable[[], CompiledRules]
+    match name:
+        case "simpler":
+            key = source_key(name, sorted(simpler.CONNECTIONS), sorted(simpler.WEIGHTS.items()))
+            build = lambda: simpler.compile_connections(simpler.CONNECTIONS, simpler.WEIGHTS)
+        case "overlapping":
+            swo = simpler_with_overlapping
+            key = source_key(name, swo.SAMPLE_MAP_ROWS, swo.SAMPLE_MAP_COLS, list(swo.SAMPLE_MAP))
+            build = lambda: swo.compile_connections(swo.analyze_map(swo.SAMPLE_MAP, swo.SAMPLE_MAP_ROWS, swo.SAMPLE_MAP_COLS))
+        case _ if name in RULESETS:
+            return builtin_rules(name, use_cache)
+        case _:
+            raise ValueError(f"unknown ruleset {name!r}, expected one of {', '.join(RULESETS)}")
+
+    return cached_rules(key, build) if use_cache else build()
+
+
+def solve_map(rules: CompiledRules, job: MapJob) -> MapResult:
+    # every job gets its own random.Random seeded from the job, so a map only depends on its seed
+    start = time.perf_counter()
+    topology = grid(job.rows, job.cols, True) if job.periodic else None
+    solver = Solver(rules, job.rows, job.cols, random.Random(job.seed), job.backtracking, job.heuristic, topology)
+    solver.run()
+    elapsed = time.perf_counter() - start
+    return MapResult(
+        job.seed,
+        job.rows,
+        job.cols,
+        solver.tiles(),
+        solver.contradiction,
+        elapsed,
+        solver.stats.backtracks,
+        solver.stats.restarts,
+    )
+
+
+# rules are handed to each worker once when it starts, instead of being pickled along with every job
+_worker_rules: Optional[CompiledRules] = None
+
+def _init_worker(rules: CompiledRules) -> None:
+    global _worker_rules
+    _worker_rules = rules
+
+def _solve_job(job: MapJob) -> MapResult:
+    assert _worker_rules is not None
+    return solve_map(_worker_rules, job)
+
+
+def generate_maps(rules: CompiledRules, jobs: Iterable[MapJob], workers: Optional[int] = None) -> Iterator[MapResult]:
+    # fans the jobs out over a process pool, results are yielded in the order they finish
+    # imported here, like the instrumentation and map file writing in run(), so `python -m wave_function_collapse
+    # generate` (see __main__.py) only imports what the maps it's asked for need
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rules,)) as pool:
+        futures = [pool.submit(_solve_job, job) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+# output formats of the generate CLI, shared by `python -m wave_function_collapse generate` and this module's main()
+FORMATS: tuple[str, ...] = ("text", "json", "ansi", "wfcmap", "png")
+
+
+def build_parser(prog: Optional[str] = None, parser: Optional[argparse.ArgumentParser] = None) -> argparse.ArgumentParser:
+    # adds the generate flags to parser (a subcommand parser of __main__.py), or to a new one
+    if parser is None:
+        parser = argparse.ArgumentParser(prog=prog, description="Generate maps without opening a window.")
+    limits = BacktrackLimits()
+    parser.add_argument("--ruleset", choices=RULESETS, default="simpler")
+    parser.add_argument("--rows", type=int, default=simpler.MAP_HEIGHT, help="map height (MAP_HEIGHT of simpler.py by default)")
+    parser.add_argument("--cols", type=int, default=simpler.MAP_WIDTH, help="map width (MAP_WIDTH of simpler.py by default)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first map, the rest count up from it")
+    parser.add_argument("--count", type=int, default=1, help="number of maps to generate")
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="text",
+        help="text (tile values), json (one object per line), ansi (colored, simpler and overlapping only), "
+             "wfcmap (binary map files) or png (tileset image, for rulesets from data/)",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="file to write text, json and ansi to (stdout by default), directory for wfcmap and png (. by default), "
+             "map files are named <ruleset>_<seed>.<format>",
+    )
+    parser.add_argument("--wrap", action="store_true", help="wrap the edges around so the maps tile seamlessly")
+    parser.add_argument(
+        "--heuristic",
+        choices=[heuristic.name.lower() for heuristic in Heuristic],
+        default="count",
+        help="cell selection, count of possible tiles or Shannon entropy of their weights",
+    )
+    parser.add_argument("--backtrack", action="store_true", help="backtrack on contradictions instead of giving up")
+    parser.add_argument("--max-depth", type=int, default=limits.max_depth, help="decisions kept for backtracking")
+    parser.add_argument("--max-trail", type=int, default=limits.max_trail, help="changes kept on the undo trail")
+    parser.add_argument("--max-restarts", type=int, default=limits.max_restarts)
+    parser.add_argument("--max-backtracks", type=int, default=limits.max_backtracks, help="decisions undone before starting over")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="worker processes for more than one map (defaults to the CPU count, 1 solves in this process)",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="compile the ruleset instead of loading it from the cache")
+    parser.add_argument("--trace", default=None, help="also solve the first map instrumented and write a Chrome trace of it here")
+    parser.add_argument("--timings", action="store_true", help="print startup, solve and output times and throughput to stderr")
+    return parser
+
+
+def write_text(out: TextIO, tiles: Sequence[int], cols: int) -> None:
+    # one line of space separated tile values per row
+    for start in range(0, len(tiles), cols):
+        out.write(" ".join(map(str, tiles[start:start + cols])))
+        out.write("\n")
+
+
+def run(args: argparse.Namespace, started: Optional[float] = None) -> int:
+    # started is when the process started (see __main__.py), --timings reports startup from there
+    imported = time.perf_counter()
+    if started is None:
+        started = imported
+
+    if args.rows <= 0 or args.cols <= 0 or args.count <= 0:
+        print("rows, cols and count must be positive", file=sys.stderr)
+        return 2
+
+    palette: Optional[Mapping[Any, str]] = None
+    if args.format == "ansi":
+        if args.ruleset == "simpler":
+            palette = simpler.PALETTE
+        elif args.ruleset == "overlapping":
+            palette = simpler_with_overlapping.PALETTE
+        else:
+            print(f"no ansi palette for {args.ruleset}, use another format", file=sys.stderr)
+            return 2
+    elif args.format == "png":
+        from .mapfile import ATLAS_PATH
+
+        # simpler and overlapping tiles are sea/coast/land values, not cells of the tileset atlas
+        if args.ruleset in ("simpler", "overlapping"):
+            print(f"no tileset images for {args.ruleset}, use another format", file=sys.stderr)
+            return 2
+
+        # the atlas path is relative to the repository root, like the viewer's texture
+        if not os.path.isfile(ATLAS_PATH):
+            print(f"png output needs the tileset atlas at {ATLAS_PATH}, run from the repository root", file=sys.stderr)
+            return 2
+
+    rules = compile_ruleset(args.ruleset, not args.no_cache)
+    compiled = time.perf_counter()
+
+    backtracking = BacktrackLimits(args.max_depth, args.max_trail, args.max_restarts, args.max_backtracks) if args.backtrack else None
+    heuristic = Heuristic[args.heuristic.upper()]
+    jobs = [MapJob(args.seed + n, args.rows, args.cols, backtracking, heuristic, args.wrap) for n in range(args.count)]
+
+    if args.trace is not None:
+        # instrumented solves don't go through the pool, so the trace covers exactly one map
+        from .instrument import instrument
+
+        job = jobs[0]
+        topology = grid(job.rows, job.cols, True) if job.periodic else None
+        solver = Solver(rules, job.rows, job.cols, random.Random(job.seed), backtracking, heuristic, topology)
+        instrumentation = instrument(solver, trace=True)
+        solver.run()
+        instrumentation.dump_trace(args.trace)
+        print(f"Trace of seed {job.seed} written to {args.trace}", file=sys.stderr)
+        print(instrumentation.summary(), file=sys.stderr)
+        compiled = time.perf_counter()
+
+    # maps are written in seed order, whichever order the workers finish them in
+    results: list[MapResult]
+    if args.workers != 1 and len(jobs) > 1:
+        results = sorted(generate_maps(rules, jobs, args.workers), key=lambda result: result.seed)
+    else:
+        results = [solve_map(rules, job) for job in jobs]
+    solved = time.perf_counter()
+
+    if args.format in ("wfcmap", "png"):
+        from .mapfile import save_map, write_png
+
+        directory = args.output if args.output is not None else "."
+        os.makedirs(directory, exist_ok=True)
+        for result in results:
+            path = os.path.join(directory, f"{args.ruleset}_{result.seed}.{args.format}")
+            if args.format == "wfcmap":
+                save_map(path, rules, result.rows, result.cols, result.tiles, result.seed)
+            else:
+                tile_rows = (result.tiles[row * result.cols:(row + 1) * result.cols] for row in range(result.rows))
+                write_png(path, result.rows, result.cols, tile_rows)
+    elif args.format == "ansi":
+        from .terminal import TerminalRenderer
+
+        assert palette is not None
+        binary: BinaryIO = open(args.output, "wb") if args.output is not None else sys.stdout.buffer
+        try:
+            renderer = TerminalRenderer(args.rows, args.cols, palette, out=binary)
+            for n, result in enumerate(results):
+                if n:
+                    binary.write(b"\n")
+                renderer.draw(result.tiles)
+        finally:
+            if binary is not sys.stdout.buffer:
+                binary.close()
+    else:
+        out: TextIO = open(args.output, "w") if args.output is not None else sys.stdout
+        try:
+            for n, result in enumerate(results):
+                if args.format == "json":
+                    json.dump({
+                        "ruleset": args.ruleset,
+                        "width": result.cols,
+                        "height": result.rows,
+                        "seed": result.seed,
+                        "tiles": result.tiles,
+                        "contradiction": result.contradiction,
+                    }, out, separators=(",", ":"))
+                    out.write("\n")
+                else:
+                    if n:
+                        out.write("\n")
+                    write_text(out, result.tiles, result.cols)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    written = time.perf_counter()
+
+    contradictions = 0
+    for result in results:
+        if result.contradiction is not None:
+            contradictions += 1
+            row, col = divmod(result.contradiction, result.cols)
+            print(f"seed {result.seed}: contradiction at row {row}, col {col}", file=sys.stderr)
+    if contradictions:
+        print(f"{contradictions} of {len(results)} maps hit a contradiction", file=sys.stderr)
+
+    if args.timings:
+        elapsed = solved - compiled
+        cells = sum(result.rows * result.cols for result in results)
+        print(
+            f"startup {(imported - started) * 1000:.1f}ms, rules {(compiled - imported) * 1000:.1f}ms, "
+            f"solve {elapsed * 1000:.1f}ms, output {(written - solved) * 1000:.1f}ms, "
+            f"raylib {'imported' if 'pyray' in sys.modules else 'not imported'}",
+            file=sys.stderr,
+        )
+        print(f"{len(results) / elapsed:.1f} maps/sec, {cells / elapsed:.0f} cells/sec", file=sys.stderr)
+        if backtracking is not None:
+            backtracks = sum(result.backtracks for result in results)
+            restarts = sum(result.restarts for result in results)
+            print(f"{backtracks} backtracks, {restarts} restarts", file=sys.stderr)
+
+    return 1 if contradictions else 0
+
+
+# main entry
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    sys.exit(run(build_parser("python -m wave_function_collapse.generate").parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
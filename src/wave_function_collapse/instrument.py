@@ -0,0 +1,159 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+import dataclasses
+import json
+import os
+import threading
+import time
+
+from .propagator import Contradiction
+from .solver import Solver
+
+
+# events hooks can be registered for, and the arguments they're called with
+#   observe(i)                 cell i was picked as the lowest entropy cell
+#   collapse(i, tile)          cell i was collapsed to tile index `tile`
+#   ban(i, domain)             cell i lost options during propagation, domain is what it has left
+#   propagate(i, shrunk)       propagation from cell i finished, shrunk is how many cells lost options
+#   contradiction(i)           cell i ran out of options
+#   backtrack(restored)        a decision was undone, restored is whether the solver could carry on from there
+EVENTS: tuple[str, ...] = ("observe", "collapse", "ban", "propagate", "contradiction", "backtrack")
+
+
+@dataclasses.dataclass
+class PhaseStats:
+    calls: int = 0
+    seconds: float = 0.0
+
+
+# profiling counters, timers and event hooks for one Solver
+# the solver itself has no instrumentation code in it: attach() wraps the bound methods of that one solver instance
+# (find_lowest_entropy, collapse, propagate, backtrack), so a solver that isn't attached runs exactly as before.
+# a trace of every phase can be recorded and dumped as Chrome trace JSON (chrome://tracing or ui.perfetto.dev).
+class Instrumentation:
+    def __init__(self, trace: bool = False, max_trace_events: int = 1_000_000) -> None:
+        self.phases: dict[str, PhaseStats] = {}
+        self.bans: int = 0
+        self.contradictions: int = 0
+        self.hooks: dict[str, list[Callable[..., None]]] = {event: [] for event in EVENTS}
+
+        self.trace = trace
+        self.max_trace_events = max_trace_events
+        self.trace_events: list[dict[str, Any]] = []
+        self._start: float = time.perf_counter()
+
+    def on(self, event: str, callback: Callable[..., None]) -> None:
+        if event not in self.hooks:
+            raise ValueError(f"unknown event {event!r}, expected one of {', '.join(EVENTS)}")
+        self.hooks[event].append(callback)
+
+    def emit(self, event: str, *args: Any) -> None:
+        for callback in self.hooks[event]:
+            callback(*args)
+
+    def record(self, phase: str, start: float, end: float, **args: Any) -> None:
+        stats = self.phases.get(phase)
+        if stats is None:
+            stats = self.phases[phase] = PhaseStats()
+        stats.calls += 1
+        stats.seconds += end - start
+
+        if self.trace and len(self.trace_events) < self.max_trace_events:
+            self.trace_events.append({
+                "name": phase,
+                "ph": "X",
+                "ts": (start - self._start) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": args,
+            })
+
+    @contextmanager
+    def timed(self, phase: str, **args: Any) -> Iterator[None]:
+        # for phases outside the solver, e.g. `with instrumentation.timed("render"): ...`
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, start, time.perf_counter(), **args)
+
+    def attach(self, solver: Solver) -> None:
+        perf_counter = time.perf_counter
+        record = self.record
+        hooks = self.hooks
+        find_lowest_entropy = solver.find_lowest_entropy
+        collapse = solver.collapse
+        propagate = solver.propagate
+        backtrack = solver.backtrack
+
+        def observe() -> Optional[int]:
+            start = perf_counter()
+            i = find_lowest_entropy()
+            record("observe", start, perf_counter())
+            if i is not None and hooks["observe"]:
+                self.emit("observe", i)
+            return i
+
+        def collapse_cell(i: int) -> int:
+            start = perf_counter()
+            t = collapse(i)
+            record("collapse", start, perf_counter(), cell=i, tile=t)
+            if hooks["collapse"]:
+                self.emit("collapse", i, t)
+            return t
+
+        def propagate_changes(changed: Iterable[int]) -> list[int]:
+            changed = list(changed)
+            start = perf_counter()
+            try:
+                shrunk = propagate(changed)
+            except Contradiction as contradiction:
+                record("propagate", start, perf_counter(), contradiction=contradiction.i)
+                self.contradictions += 1
+                if hooks["contradiction"]:
+                    self.emit("contradiction", contradiction.i)
+                raise
+            record("propagate", start, perf_counter(), shrunk=len(shrunk))
+
+            self.bans += len(shrunk)
+            if hooks["ban"]:
+                domains = solver.wave.domains
+                for i in shrunk:
+                    self.emit("ban", i, domains[i])
+            if hooks["propagate"]:
+                self.emit("propagate", changed[0] if changed else -1, len(shrunk))
+            return shrunk
+
+        def backtrack_decision() -> bool:
+            start = perf_counter()
+            restored = backtrack()
+            record("backtrack", start, perf_counter(), restored=restored)
+            if hooks["backtrack"]:
+                self.emit("backtrack", restored)
+            return restored
+
+        solver.find_lowest_entropy = observe  # type: ignore[method-assign]
+        solver.collapse = collapse_cell  # type: ignore[method-assign]
+        solver.propagate = propagate_changes  # type: ignore[method-assign]
+        solver.backtrack = backtrack_decision  # type: ignore[method-assign]
+
+    def summary(self) -> str:
+        total = sum(stats.seconds for stats in self.phases.values()) or 1.0
+        lines = [f"{'phase':<12} {'calls':>10} {'seconds':>10} {'share':>7}"]
+        for phase, stats in sorted(self.phases.items(), key=lambda item: -item[1].seconds):
+            lines.append(f"{phase:<12} {stats.calls:>10} {stats.seconds:>10.4f} {stats.seconds / total:>7.1%}")
+        lines.append(f"{self.bans} cells shrunk by propagation, {self.contradictions} contradictions")
+        return "\n".join(lines)
+
+    def dump_trace(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump({"traceEvents": self.trace_events, "displayTimeUnit": "ms"}, file)
+
+
+def instrument(solver: Solver, trace: bool = False) -> Instrumentation:
+    instrumentation = Instrumentation(trace)
+    instrumentation.attach(solver)
+    return instrumentation
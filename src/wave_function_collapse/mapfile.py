@@ -0,0 +1,348 @@
+from __future__ import annotations
+from array import array
+from typing import BinaryIO, Iterable, Iterator, NamedTuple, Optional, Sequence
+
+import hashlib
+import mmap
+import struct
+import sys
+import zlib
+
+from .cache import dump_rules
+from .rules import CompiledRules
+from .wave import UNSET
+
+
+# map file, everything little endian:
+#   header: magic, format version, bytes per tile index (1 or 2), rows, cols, tile count, seed, sha256 of the ruleset
+#   tile values (int64 each), tile index -> tile value
+#   rows * cols tile indices, row by row, the largest index (0xff or 0xffff) for cells that never got a tile
+MAGIC: bytes = b"WFCM"
+FORMAT_VERSION: int = 1
+HEADER = struct.Struct("<4sHBxIIIq32s")
+
+# tileset the viewer draws with, tile values are indices into its grid of tiles
+ATLAS_PATH: str = "assets/tiles_packed.png"
+ATLAS_COLS: int = 12
+ATLAS_TILE_SIZE: int = 16
+
+
+class MapHeader(NamedTuple):
+    rows: int
+    cols: int
+    # tile index -> tile value
+    tiles: tuple[int, ...]
+    seed: int
+    # sha256 of the compiled ruleset the map was solved with (see ruleset_hash())
+    ruleset_hash: bytes
+
+
+def ruleset_hash(rules: CompiledRules) -> bytes:
+    return hashlib.sha256(dump_rules(rules)).digest()
+
+
+def index_size(tile_count: int) -> int:
+    # bytes per tile index, one index is kept free for UNSET
+    if tile_count < 0xff:
+        return 1
+    if tile_count < 0xffff:
+        return 2
+    raise ValueError(f"{tile_count} tiles don't fit in a map file")
+
+
+def write_map(
+        file: BinaryIO,
+        rules: CompiledRules,
+        rows: int,
+        cols: int,
+        tiles: Sequence[int],
+        seed: int = 0
+    ) -> None:
+    # tiles are tile values (as returned by Solver.tiles()), UNSET for cells without one
+    size = index_size(len(rules.tiles))
+    unset = (1 << (size * 8)) - 1
+    index: dict[int, int] = {tile: i for i, tile in enumerate(rules.tiles)}
+    index[UNSET] = unset
+    if len(tiles) != rows * cols:
+        raise ValueError(f"expected {rows * cols} tiles, got {len(tiles)}")
+
+    indices = array("B" if size == 1 else "H", map(index.__getitem__, tiles))
+    if sys.byteorder != "little":
+        indices.byteswap()
+
+    file.write(HEADER.pack(MAGIC, FORMAT_VERSION, size, rows, cols, len(rules.tiles), seed, ruleset_hash(rules)))
+    file.write(struct.pack(f"<{len(rules.tiles)}q", *rules.tiles))
+    file.write(indices.tobytes())
+
+
+def save_map(path: str, rules: CompiledRules, rows: int, cols: int, tiles: Sequence[int], seed: int = 0) -> None:
+    with open(path, "wb") as file:
+        write_map(file, rules, rows, cols, tiles, seed)
+
+
+# a map file opened through mmap, so a huge map can be sliced without reading all of it
+# rows and regions are copied out of the mapped file into arrays, only the pages they touch are read from disk.
+# `indices` is a view of the mapped file itself, it is released by close() and can't be used after that
+class MapFile:
+    def __init__(self, path: str) -> None:
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is empty")
+
+        view = memoryview(self._mmap)
+        try:
+            if len(view) < HEADER.size:
+                raise ValueError(f"{path} is not a map file")
+            magic, version, size, rows, cols, tile_count, seed, hash = HEADER.unpack_from(view)
+            if magic != MAGIC or version != FORMAT_VERSION or size not in (1, 2):
+                raise ValueError(f"{path} is not a version {FORMAT_VERSION} map file")
+
+            tiles_at = HEADER.size
+            indices_at = tiles_at + tile_count * 8
+            if len(view) != indices_at + rows * cols * size:
+                raise ValueError(f"{path} is truncated")
+
+            tiles = struct.unpack_from(f"<{tile_count}q", view, tiles_at)
+            if size == 2 and sys.byteorder != "little":
+                raise ValueError("reading 16-bit map files needs a little endian machine")
+        except BaseException:
+            view.release()
+            self.close()
+            raise
+
+        self.header = MapHeader(rows, cols, tiles, seed, hash)
+        self.rows: int = rows
+        self.cols: int = cols
+        self.unset: int = (1 << (size * 8)) - 1
+        # tile indices, row by row
+        self.indices: memoryview = view[indices_at:].cast("B" if size == 1 else "H")
+        self._view = view
+
+    def close(self) -> None:
+        for name in ("indices", "_view"):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+        if getattr(self, "_mmap", None) is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> MapFile:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def row(self, row: int) -> array[int]:
+        # tile indices of one row, a copy that stays valid after close()
+        return array(self.indices.format, self.indices[row * self.cols:(row + 1) * self.cols])
+
+    def region(self, top: int, left: int, rows: int, cols: int) -> Iterator[array[int]]:
+        # tile indices of a rectangle, one row at a time
+        for row in range(top, min(top + rows, self.rows)):
+            start = row * self.cols
+            yield array(self.indices.format, self.indices[start + left:start + min(left + cols, self.cols)])
+
+    def tile(self, row: int, col: int) -> int:
+        # tile value at (row, col), or UNSET
+        t = self.indices[row * self.cols + col]
+        return UNSET if t == self.unset else self.header.tiles[t]
+
+    def tile_values(self) -> list[int]:
+        tiles = self.header.tiles + (UNSET,) * (self.unset + 1 - len(self.header.tiles))
+        return [tiles[t] for t in self.indices]
+
+
+# just enough PNG to read the 8-bit palette atlas and write maps made from its tiles
+PNG_SIGNATURE: bytes = b"\x89PNG\r\n\x1a\n"
+
+
+class IndexedImage(NamedTuple):
+    width: int
+    height: int
+    # palette index of each pixel, row by row
+    pixels: bytes
+    # PLTE and tRNS chunk data, copied as is into written images
+    palette: bytes
+    transparency: Optional[bytes]
+
+
+def _paeth(a: int, b: int, c: int) -> int:
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    return b if pb <= pc else c
+
+
+def read_indexed_png(path: str) -> IndexedImage:
+    with open(path, "rb") as file:
+        data = file.read()
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError(f"{path} is not a PNG")
+
+    at = len(PNG_SIGNATURE)
+    header: Optional[tuple[int, ...]] = None
+    palette = b""
+    transparency: Optional[bytes] = None
+    compressed: list[bytes] = []
+    while at < len(data):
+        length, kind = struct.unpack_from(">I4s", data, at)
+        chunk = data[at + 8:at + 8 + length]
+        at += 12 + length
+        if kind == b"IHDR":
+            header = struct.unpack(">IIBBBBB", chunk)
+        elif kind == b"PLTE":
+            palette = chunk
+        elif kind == b"tRNS":
+            transparency = chunk
+        elif kind == b"IDAT":
+            compressed.append(chunk)
+        elif kind == b"IEND":
+            break
+
+    if header is None:
+        raise ValueError(f"{path} has no IHDR")
+    width, height, depth, color_type, _, _, interlace = header
+    if depth != 8 or color_type != 3 or interlace != 0:
+        raise ValueError(f"{path} must be an 8-bit, non-interlaced palette PNG")
+
+    # undo the per-row filters, one byte per pixel
+    raw = zlib.decompress(b"".join(compressed))
+    pixels = bytearray(width * height)
+    previous = bytearray(width)
+    stride = width + 1
+    for y in range(height):
+        kind = raw[y * stride]
+        line = bytearray(raw[y * stride + 1:(y + 1) * stride])
+        if kind == 1:
+            for x in range(1, width):
+                line[x] = (line[x] + line[x - 1]) & 0xff
+        elif kind == 2:
+            for x in range(width):
+                line[x] = (line[x] + previous[x]) & 0xff
+        elif kind == 3:
+            for x in range(width):
+                left = line[x - 1] if x else 0
+                line[x] = (line[x] + ((left + previous[x]) >> 1)) & 0xff
+        elif kind == 4:
+            for x in range(width):
+                left = line[x - 1] if x else 0
+                up_left = previous[x - 1] if x else 0
+                line[x] = (line[x] + _paeth(left, previous[x], up_left)) & 0xff
+        elif kind != 0:
+            raise ValueError(f"{path} has an unknown filter type {kind}")
+        pixels[y * width:(y + 1) * width] = line
+        previous = line
+
+    return IndexedImage(width, height, bytes(pixels), palette, transparency)
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def write_png(
+        path: str,
+        rows: int,
+        cols: int,
+        tile_rows: Iterable[Sequence[int]],
+        atlas_path: str = ATLAS_PATH,
+        atlas_cols: int = ATLAS_COLS,
+        tile_size: int = ATLAS_TILE_SIZE
+    ) -> None:
+    # composes a map out of the atlas' tiles (tile values are indices into the atlas grid) into a palette PNG
+    # with the atlas' palette, so no pixel is ever converted. tile_rows yields the tile values of one map row
+    # at a time and the image is written as they come, so memory stays at one row of tiles no matter how big
+    # the map is. cells without a tile use palette index 0
+    atlas = read_indexed_png(atlas_path)
+    atlas_tiles = (atlas.width // tile_size) * (atlas.height // tile_size)
+
+    # tile value -> its tile_size rows of pixels, cut out of the atlas once
+    blank = [bytes(tile_size)] * tile_size
+    cut: dict[int, list[bytes]] = {}
+
+    def tile_pixels(tile: int) -> list[bytes]:
+        pixels = cut.get(tile)
+        if pixels is None:
+            if tile == UNSET or not 0 <= tile < atlas_tiles:
+                pixels = blank
+            else:
+                x = (tile % atlas_cols) * tile_size
+                y = (tile // atlas_cols) * tile_size
+                pixels = [atlas.pixels[(y + dy) * atlas.width + x:(y + dy) * atlas.width + x + tile_size] for dy in range(tile_size)]
+            cut[tile] = pixels
+        return pixels
+
+    compressor = zlib.compressobj(9)
+    with open(path, "wb") as file:
+        file.write(PNG_SIGNATURE)
+        file.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", cols * tile_size, rows * tile_size, 8, 3, 0, 0, 0)))
+        file.write(_chunk(b"PLTE", atlas.palette))
+        if atlas.transparency is not None:
+            file.write(_chunk(b"tRNS", atlas.transparency))
+
+        for row in tile_rows:
+            cells = [tile_pixels(tile) for tile in row]
+            # filter type 0 (none) in front of every scanline
+            scanlines = b"".join(b"\0" + b"".join(cell[dy] for cell in cells) for dy in range(tile_size))
+            data = compressor.compress(scanlines)
+            if data:
+                file.write(_chunk(b"IDAT", data))
+
+        file.write(_chunk(b"IDAT", compressor.flush()))
+        file.write(_chunk(b"IEND", b""))
+
+
+def export_png(
+        mapfile: MapFile,
+        path: str,
+        atlas_path: str = ATLAS_PATH,
+        atlas_cols: int = ATLAS_COLS,
+        tile_size: int = ATLAS_TILE_SIZE
+    ) -> None:
+    # the map file is read a row at a time, see write_png()
+    tiles = mapfile.header.tiles + (UNSET,) * (mapfile.unset + 1 - len(mapfile.header.tiles))
+    tile_rows = ([tiles[t] for t in mapfile.row(row)] for row in range(mapfile.rows))
+    write_png(path, mapfile.rows, mapfile.cols, tile_rows, atlas_path, atlas_cols, tile_size)
+
+
+# main entry
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    import argparse
+    import os
+    import random
+    import tempfile
+    import time
+
+    from .ruleset import builtin_rules
+    from .solver import BacktrackLimits, Solver
+
+    parser = argparse.ArgumentParser(description="Write a solved map to a map file and a PNG of its tiles.")
+    parser.add_argument("--output", default=None, help="directory to write map.wfcmap and map.png to (a new temporary directory by default)")
+    args = parser.parse_args(argv)
+    directory = args.output if args.output is not None else tempfile.mkdtemp(prefix="wfc-map-")
+    os.makedirs(directory, exist_ok=True)
+    map_path = os.path.join(directory, "map.wfcmap")
+    png_path = os.path.join(directory, "map.png")
+
+    # the coast ruleset's tile values are atlas indices, so the PNG shows the actual tiles
+    seed: int = 0
+    rows, cols = (64, 64)
+    rules = builtin_rules("coast")
+    solver = Solver(rules, rows, cols, random.Random(seed), BacktrackLimits())
+    solver.run()
+
+    start = time.perf_counter()
+    save_map(map_path, rules, rows, cols, solver.tiles(), seed)
+    with MapFile(map_path) as mapfile:
+        assert mapfile.tile_values() == solver.tiles()
+        export_png(mapfile, png_path)
+    print(f"Wrote {map_path} and {png_path} in {time.perf_counter() - start:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
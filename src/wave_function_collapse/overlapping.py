@@ -0,0 +1,193 @@
+from __future__ import annotations
+from collections import Counter
+from typing import NamedTuple, Optional, Sequence
+
+import random
+import time
+
+from .rules import CompiledRules
+from .solver import BacktrackLimits, Solver
+from .wave import UNSET
+
+
+# a pattern is an NxN window of tile values, row by row
+Pattern = tuple[int, ...]
+
+
+class OverlappingModel(NamedTuple):
+    n: int
+    # pattern index -> pattern
+    patterns: tuple[Pattern, ...]
+    # pattern index -> times it was found in the sample (counting rotations and reflections)
+    counts: tuple[int, ...]
+    # rules over pattern indices, a cell's tile value is the top left tile of its pattern
+    rules: CompiledRules
+
+
+def rotate(pattern: Pattern, n: int) -> Pattern:
+    # 90 degrees clockwise
+    return tuple(pattern[(n - 1 - col) * n + row] for row in range(n) for col in range(n))
+
+def reflect(pattern: Pattern, n: int) -> Pattern:
+    # mirrored left to right
+    return tuple(pattern[row * n + (n - 1 - col)] for row in range(n) for col in range(n))
+
+def symmetries(pattern: Pattern, n: int, symmetry: int) -> list[Pattern]:
+    # the first `symmetry` (1 to 8) of: the pattern, its reflection, and both rotated 90, 180 and 270 degrees
+    variants: list[Pattern] = []
+    for _ in range(4):
+        variants.append(pattern)
+        variants.append(reflect(pattern, n))
+        pattern = rotate(pattern, n)
+
+    return variants[:symmetry]
+
+
+def extract_patterns(
+        sample: Sequence[int],
+        rows: int,
+        cols: int,
+        n: int = 3,
+        periodic: bool = True,
+        symmetry: int = 8
+    ) -> Counter[Pattern]:
+    # every NxN window of the sample, a periodic sample wraps around so windows can hang off the right and bottom edges
+    if not 1 <= symmetry <= 8:
+        raise ValueError(f"symmetry must be between 1 and 8, got {symmetry}")
+
+    counts: Counter[Pattern] = Counter()
+    window_rows = rows if periodic else rows - n + 1
+    window_cols = cols if periodic else cols - n + 1
+    for row in range(window_rows):
+        # the n sample rows under this window, extended by n - 1 wrapped tiles so every window is a plain slice
+        lines = []
+        for dy in range(n):
+            start = (row + dy) % rows * cols
+            line = sample[start:start + cols]
+            lines.append(tuple(line) + tuple(line[:n - 1]))
+
+        for col in range(window_cols):
+            pattern = tuple(tile for line in lines for tile in line[col:col + n])
+            if symmetry == 1:
+                counts[pattern] += 1
+            else:
+                counts.update(symmetries(pattern, n, symmetry))
+
+    return counts
+
+
+def overlap_rules(patterns: Sequence[Pattern], weights: Sequence[float], n: int) -> CompiledRules:
+    # pattern b may sit in a direction of pattern a when they agree on the n - 1 rows (or columns) they share
+    # once shifted by one cell. instead of comparing every pair of patterns, patterns are bucketed by each of their
+    # edge slices (all but one row or column) and each pattern looks its compatible bucket up, so this is O(P * N^2)
+    top: list[Pattern] = []
+    bottom: list[Pattern] = []
+    left: list[Pattern] = []
+    right: list[Pattern] = []
+    for pattern in patterns:
+        top.append(pattern[:n * (n - 1)])
+        bottom.append(pattern[n:])
+        left.append(tuple(tile for row in range(n) for tile in pattern[row * n:row * n + n - 1]))
+        right.append(tuple(tile for row in range(n) for tile in pattern[row * n + 1:row * n + n]))
+
+    def buckets(slices: list[Pattern]) -> dict[Pattern, int]:
+        # slice -> mask of patterns with that slice
+        masks: dict[Pattern, int] = {}
+        for p, key in enumerate(slices):
+            masks[key] = masks.get(key, 0) | 1 << p
+        return masks
+
+    by_top, by_bottom, by_left, by_right = buckets(top), buckets(bottom), buckets(left), buckets(right)
+    allowed = (
+        # UP: the pattern above a ends with a's top rows
+        tuple(by_bottom.get(key, 0) for key in top),
+        # DOWN: the pattern below a starts with a's bottom rows
+        tuple(by_top.get(key, 0) for key in bottom),
+        # LEFT
+        tuple(by_right.get(key, 0) for key in left),
+        # RIGHT
+        tuple(by_left.get(key, 0) for key in right),
+    )
+
+    return CompiledRules(
+        tiles=tuple(pattern[0] for pattern in patterns),
+        weights=tuple(weights),
+        allowed=allowed,
+    )
+
+
+def build_model(
+        sample: Sequence[int],
+        rows: int,
+        cols: int,
+        n: int = 3,
+        periodic: bool = True,
+        symmetry: int = 8
+    ) -> OverlappingModel:
+    counts = extract_patterns(sample, rows, cols, n, periodic, symmetry)
+    # dict order is insertion order, so the same sample always gives the same pattern indices
+    patterns = tuple(counts)
+    weights = tuple(counts.values())
+    return OverlappingModel(n, patterns, weights, overlap_rules(patterns, [float(w) for w in weights], n))
+
+
+def output_size(model: OverlappingModel, rows: int, cols: int) -> tuple[int, int]:
+    # patterns needed for a rows x cols map, the last pattern of each row and column covers the remaining n - 1 tiles
+    if rows < model.n or cols < model.n:
+        raise ValueError(f"a map made of {model.n}x{model.n} patterns needs at least {model.n} rows and cols, got {rows}x{cols}")
+    return rows - model.n + 1, cols - model.n + 1
+
+
+def render_tiles(model: OverlappingModel, solver: Solver, rows: int, cols: int) -> list[int]:
+    # tile values of a rows x cols map from a solved (rows - n + 1) x (cols - n + 1) pattern grid
+    n = model.n
+    pattern_rows, pattern_cols = solver.rows, solver.cols
+    tiles: list[int] = [UNSET] * (rows * cols)
+    for row in range(rows):
+        pattern_row = min(row, pattern_rows - 1)
+        dy = row - pattern_row
+        for col in range(cols):
+            pattern_col = min(col, pattern_cols - 1)
+            p = solver.wave.index(pattern_row * pattern_cols + pattern_col)
+            if p != UNSET:
+                tiles[row * cols + col] = model.patterns[p][dy * n + col - pattern_col]
+
+    return tiles
+
+
+def solve(
+        model: OverlappingModel,
+        rows: int,
+        cols: int,
+        rng: Optional[random.Random] = None,
+        backtracking: Optional[BacktrackLimits] = None
+    ) -> tuple[Solver, list[int]]:
+    pattern_rows, pattern_cols = output_size(model, rows, cols)
+    solver = Solver(model.rules, pattern_rows, pattern_cols, rng, backtracking)
+    solver.run()
+    return solver, render_tiles(model, solver, rows, cols)
+
+
+# main entry
+def main() -> None:
+    from .simpler_with_overlapping import MAP_HEIGHT, MAP_WIDTH, SAMPLE_MAP, SAMPLE_MAP_COLS, SAMPLE_MAP_ROWS, Tiles, render_map
+
+    print("Sample Map")
+    render_map(SAMPLE_MAP_ROWS, SAMPLE_MAP_COLS, SAMPLE_MAP)
+    print(end="\n")
+
+    start = time.perf_counter()
+    model = build_model(SAMPLE_MAP, SAMPLE_MAP_ROWS, SAMPLE_MAP_COLS, n=3)
+    print(f"{len(model.patterns)} patterns of {model.n}x{model.n} in {time.perf_counter() - start:.3f}s")
+
+    solver, tiles = solve(model, MAP_HEIGHT, MAP_WIDTH, backtracking=BacktrackLimits())
+    if solver.contradiction is not None:
+        row, col = divmod(solver.contradiction, solver.cols)
+        print(f"Contradiction at row {row}, col {col}")
+
+    print("Generated Map")
+    render_map(MAP_HEIGHT, MAP_WIDTH, [Tiles(tile) for tile in tiles])
+
+
+if __name__ == "__main__":
+    main()
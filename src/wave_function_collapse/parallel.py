@@ -0,0 +1,325 @@
+from __future__ import annotations
+from array import array
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, NamedTuple, Optional, Sequence
+
+import argparse
+import functools
+import math
+import os
+import random
+import sys
+import time
+
+from .propagator import Contradiction
+from .rules import CompiledRules
+from .solver import BacktrackLimits, Solver
+from .topology import border_constraints
+from .wave import UNSET
+
+
+MODES: tuple[str, ...] = ("auto", "threads", "processes")
+
+
+class Rect(NamedTuple):
+    top: int
+    left: int
+    rows: int
+    cols: int
+
+
+class RectJob(NamedTuple):
+    rect: Rect
+    # seed of the rect's random.Random
+    seed: str
+    # (cell within the rect, mask) limits from the solved cells around it
+    constraints: list[tuple[int, int]]
+    # time the solve may take before the rect counts as failed, from when a worker starts on it
+    seconds: float = math.inf
+
+
+class ParallelResult(NamedTuple):
+    rows: int
+    cols: int
+    # tile values, UNSET for cells that never got a tile
+    tiles: list[int]
+    # cell that ran out of tiles, only possible after falling back to a sequential solve
+    contradiction: Optional[int]
+    elapsed: float
+    # seconds spent on region interiors, on seams, and on repairing failed rects plus the final validity check
+    phase_seconds: tuple[float, float, float]
+    regions: int
+    seams: int
+    # failed rects that were solved again, grown into their surroundings
+    repairs: int
+    # the pieces didn't fit together even after repairs, so the whole map was solved sequentially
+    fallback: bool
+    # "threads" or "processes"
+    mode: str
+    workers: int
+
+
+def free_threaded() -> bool:
+    # sys._is_gil_enabled() only exists since 3.13, and is False on a free-threaded (3.13t) build running without the GIL
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def partition(rows: int, cols: int, region_size: int, margin: int) -> tuple[list[Rect], list[Rect], list[Rect]]:
+    # splits the map into region_size squares, with a seam 2 * margin cells wide left between neighboring regions:
+    # (region interiors, vertical seams between regions of the same band, horizontal seams running across the map)
+    # interiors touch nothing but seams, vertical seams touch nothing but interiors and horizontal seams,
+    # so each of the three lists can be solved concurrently, in that order
+    if region_size <= 2 * margin:
+        raise ValueError(f"regions of {region_size} cells can't fit seams of {2 * margin}")
+
+    def spans(size: int) -> list[tuple[int, int]]:
+        # (start, end) of every band, without its share of the seams
+        # a trailing band too short to hold its half of the seam and at least one cell is merged into the one before
+        count = max(1, -(-size // region_size))
+        if count > 1 and size - (count - 1) * region_size <= margin:
+            count -= 1
+        bounds = [n * region_size for n in range(count)] + [size]
+        return [
+            (bounds[n] + (margin if n > 0 else 0), bounds[n + 1] - (margin if n < count - 1 else 0))
+            for n in range(count)
+        ]
+
+    row_spans = spans(rows)
+    col_spans = spans(cols)
+    interiors = [Rect(top, left, bottom - top, right - left) for top, bottom in row_spans for left, right in col_spans]
+    vertical = [
+        Rect(top, right, bottom - top, min(cols, next_left) - right)
+        for top, bottom in row_spans
+        for (_, right), (next_left, _) in zip(col_spans, col_spans[1:])
+    ]
+    # seams are clipped to the map, which only matters for maps smaller than a seam
+    horizontal = [
+        Rect(bottom, 0, min(rows, next_top) - bottom, cols)
+        for (_, bottom), (next_top, _) in zip(row_spans, row_spans[1:])
+    ]
+    return interiors, vertical, horizontal
+
+
+def rect_constraints(rules: CompiledRules, grid: Sequence[int], rows: int, cols: int, rect: Rect) -> list[tuple[int, int]]:
+    # (cell within rect, mask) for every cell on the rect's edge with a solved cell right outside of it
+    def outside(row: int, col: int) -> int:
+        return grid[row * cols + col] if 0 <= row < rows and 0 <= col < cols else UNSET
+
+    return border_constraints(rules.allowed, rect.top, rect.left, rect.rows, rect.cols, outside)
+
+
+def solve_rect(rules: CompiledRules, backtracking: Optional[BacktrackLimits], job: RectJob) -> Optional[array[int]]:
+    # tile indices of the rect, row by row, or None if it contradicted or wasn't done within job.seconds
+    # constraints that can't be met don't always show up in propagation, the time limit stops backtracking from
+    # searching through every way to fill the rect before giving up (the rect is repaired later instead)
+    deadline = time.perf_counter() + job.seconds
+    rect = job.rect
+    solver = Solver(rules, rect.rows, rect.cols, random.Random(job.seed), backtracking)
+    try:
+        solver.constrain(job.constraints)
+    except Contradiction:
+        return None
+    if not solver.run_until(deadline).done or solver.contradiction is not None:
+        return None
+
+    wave = solver.wave
+    return array("i", [wave.index(i) for i in range(wave.size)])
+
+
+# worker processes get the rules once when they start, as in generate.py. every solve_parallel() call starts its
+# own process pool, so these are never shared between calls. threads are bound to their call's rules instead
+# (see solve_parallel()), since all threads of a process would share these
+_worker_rules: Optional[CompiledRules] = None
+_worker_backtracking: Optional[BacktrackLimits] = None
+
+def _init_worker(rules: CompiledRules, backtracking: Optional[BacktrackLimits]) -> None:
+    global _worker_rules, _worker_backtracking
+    _worker_rules = rules
+    _worker_backtracking = backtracking
+
+def _solve_job(job: RectJob) -> Optional[array[int]]:
+    assert _worker_rules is not None
+    return solve_rect(_worker_rules, _worker_backtracking, job)
+
+
+def paste(grid: array[int], cols: int, rect: Rect, indices: array[int]) -> None:
+    top, left, height, width = rect
+    for row in range(height):
+        start = (top + row) * cols + left
+        grid[start:start + width] = indices[row * width:(row + 1) * width]
+
+
+def grow(rect: Rect, by: int, rows: int, cols: int) -> Rect:
+    top = max(0, rect.top - by)
+    left = max(0, rect.left - by)
+    bottom = min(rows, rect.top + rect.rows + by)
+    right = min(cols, rect.left + rect.cols + by)
+    return Rect(top, left, bottom - top, right - left)
+
+
+def find_violation(rules: CompiledRules, rows: int, cols: int, grid: Sequence[int]) -> Optional[int]:
+    # first cell that is unset or sits next to a tile it isn't allowed next to (checked from both sides), or None
+    allowed = rules.allowed
+    down, up, right, left = allowed[1], allowed[0], allowed[3], allowed[2]
+    for i, t in enumerate(grid):
+        if t == UNSET:
+            return i
+        row, col = divmod(i, cols)
+        if col < cols - 1:
+            n = grid[i + 1]
+            if n != UNSET and not ((right[t] >> n) & 1 and (left[n] >> t) & 1):
+                return i
+        if row < rows - 1:
+            n = grid[i + cols]
+            if n != UNSET and not ((down[t] >> n) & 1 and (up[n] >> t) & 1):
+                return i
+
+    return None
+
+
+# region-partitioned solve: the map is cut into regions whose interiors are solved concurrently, then the seams
+# between them are solved with the tiles on either side as constraints (Solver.constrain(), as chunks.py does
+# for neighboring chunks), vertical seams first and then the horizontal ones that cross them.
+# a rect that contradicts or takes longer than rect_seconds is solved again later (repair_seconds at most per attempt),
+# grown by `margin` into its surroundings each time, and if the pieces still don't fit the whole map is solved
+# sequentially, so the result is always as valid as Solver's.
+# runs on threads on free-threaded builds and on processes otherwise, where threads would just take turns on the GIL
+def solve_parallel(
+        rules: CompiledRules,
+        rows: int,
+        cols: int,
+        seed: int = 0,
+        workers: Optional[int] = None,
+        region_size: int = 128,
+        margin: int = 2,
+        backtracking: Optional[BacktrackLimits] = BacktrackLimits(),
+        mode: str = "auto",
+        max_repairs: int = 3,
+        repair_seconds: float = 1.0,
+        rect_seconds: float = 10.0
+    ) -> ParallelResult:
+    if mode not in MODES:
+        raise ValueError(f"unknown mode {mode!r}, expected one of {', '.join(MODES)}")
+    if mode == "auto":
+        mode = "threads" if free_threaded() else "processes"
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+
+    start = time.perf_counter()
+    interiors, vertical, horizontal = partition(rows, cols, region_size, margin)
+    grid: array[int] = array("i", [UNSET]) * (rows * cols)
+    failed: list[Rect] = []
+    phase_seconds: list[float] = [0.0, 0.0, 0.0]
+
+    pool: Executor
+    solve_job: Callable[[RectJob], Optional[array[int]]]
+    if mode == "threads":
+        pool = ThreadPoolExecutor(workers)
+        solve_job = functools.partial(solve_rect, rules, backtracking)
+    else:
+        pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(rules, backtracking))
+        solve_job = _solve_job
+
+    with pool:
+        # interiors, then vertical seams, then horizontal seams, the two seam phases are timed together
+        for phase, rects in ((0, interiors), (1, vertical), (1, horizontal)):
+            phase_start = time.perf_counter()
+            # constraints are taken from the grid before any rect of the phase is pasted, the rects don't touch anyway
+            jobs = [
+                RectJob(rect, f"{seed}:{rect.top}:{rect.left}", rect_constraints(rules, grid, rows, cols, rect), rect_seconds)
+                for rect in rects
+            ]
+            for job, indices in zip(jobs, pool.map(solve_job, jobs, chunksize=max(1, len(jobs) // (workers * 4)))):
+                if indices is None:
+                    failed.append(job.rect)
+                else:
+                    paste(grid, cols, job.rect, indices)
+            phase_seconds[phase] += time.perf_counter() - phase_start
+
+    # failed rects are redone one by one, now that everything around them is solved
+    repair_start = time.perf_counter()
+    repairs = 0
+    for rect in failed:
+        for attempt in range(max_repairs):
+            repairs += 1
+            grown = grow(rect, margin * attempt, rows, cols)
+            constraints = rect_constraints(rules, grid, rows, cols, grown)
+            job = RectJob(grown, f"{seed}:{grown.top}:{grown.left}:{attempt}", constraints, repair_seconds)
+            indices = solve_rect(rules, backtracking, job)
+            if indices is not None:
+                paste(grid, cols, grown, indices)
+                break
+
+    contradiction: Optional[int] = None
+    fallback = find_violation(rules, rows, cols, grid) is not None
+    if fallback:
+        solver = Solver(rules, rows, cols, random.Random(seed), backtracking)
+        solver.run()
+        contradiction = solver.contradiction
+        grid = array("i", [solver.wave.index(i) for i in range(solver.wave.size)])
+    phase_seconds[2] = time.perf_counter() - repair_start
+
+    tiles = rules.tiles
+    return ParallelResult(
+        rows,
+        cols,
+        [tiles[t] if t != UNSET else UNSET for t in grid],
+        contradiction,
+        time.perf_counter() - start,
+        (phase_seconds[0], phase_seconds[1], phase_seconds[2]),
+        len(interiors),
+        len(vertical) + len(horizontal),
+        repairs,
+        fallback,
+        mode,
+        workers,
+    )
+
+
+# main entry
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    from .generate import RULESETS, compile_ruleset
+
+    parser = argparse.ArgumentParser(description="Solve one big map in parallel regions and compare against a sequential solve.")
+    parser.add_argument("--ruleset", choices=RULESETS, default="simpler")
+    parser.add_argument("--rows", type=int, default=512)
+    parser.add_argument("--cols", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="worker threads or processes (defaults to the CPU count)")
+    parser.add_argument("--region-size", type=int, default=128, help="side of the square regions solved concurrently")
+    parser.add_argument("--margin", type=int, default=2, help="seam cells on either side of a region border")
+    parser.add_argument("--mode", choices=MODES, default="auto", help="threads on free-threaded builds, processes otherwise")
+    parser.add_argument("--rect-seconds", type=float, default=10.0, help="time a region or seam may take before it's repaired instead")
+    parser.add_argument("--no-compare", action="store_true", help="skip the sequential solve the speedup is measured against")
+    args = parser.parse_args(argv)
+
+    rules = compile_ruleset(args.ruleset)
+    result = solve_parallel(
+        rules, args.rows, args.cols, args.seed, args.workers, args.region_size, args.margin,
+        mode=args.mode, rect_seconds=args.rect_seconds,
+    )
+    interiors, seams, repairs = result.phase_seconds
+    print(f"{result.rows}x{result.cols} on {result.workers} {result.mode} in {result.elapsed:.2f}s")
+    print(f"{result.regions} regions {interiors:.2f}s, {result.seams} seams {seams:.2f}s, {result.repairs} repairs {repairs:.2f}s")
+    if result.fallback:
+        print("seams couldn't be reconciled, fell back to a sequential solve")
+
+    index = {tile: t for t, tile in enumerate(rules.tiles)}
+    violation = find_violation(rules, result.rows, result.cols, [index.get(tile, UNSET) for tile in result.tiles])
+    if violation is None:
+        print("every cell is set and follows the rules")
+    else:
+        row, col = divmod(violation, result.cols)
+        print(f"invalid or unset cell at row {row}, col {col}")
+
+    if args.no_compare:
+        return
+
+    start = time.perf_counter()
+    Solver(rules, args.rows, args.cols, random.Random(args.seed), BacktrackLimits()).run()
+    sequential = time.perf_counter() - start
+    print(f"sequential {sequential:.2f}s, speedup {sequential / result.elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+from __future__ import annotations
+from typing import Iterable
+
+from .rules import supported_mask
+from .topology import NO_NEIGHBOR, Topology
+from .wave import Wave
+
+
+# cached unions are cleared past this many entries, large tilesets can have a lot of distinct option sets
+SUPPORTED_CACHE_SIZE: int = 1 << 16
+
+
+class Contradiction(Exception):
+    # raised as soon as a cell runs out of possible tiles
+    def __init__(self, i: int) -> None:
+        super().__init__(f"cell {i} has no possible tiles left")
+        self.i = i
+
+
+# worklist (AC-3 style) propagator
+# every cell whose options shrink is pushed onto the worklist, and its neighbors are re-checked against it,
+# so removals cascade across the whole map until nothing changes (instead of stopping at the direct neighbors)
+# neighbors come from the topology's precomputed table, so wrapping, hex and voxel grids cost the same as square ones
+class Propagator:
+    def __init__(self, wave: Wave, topology: Topology) -> None:
+        self.wave = wave
+        self.topology = topology
+        # union of allowed neighbors for a set of options, keyed by (direction, options mask)
+        # the same handful of option sets come up over and over, so each union is only built once
+        self._supported: dict[tuple[int, int], int] = {}
+
+    def supported(self, direction: int, mask: int) -> int:
+        # mask of every tile that can sit in `direction` of at least one tile in `mask`
+        key = (direction, mask)
+        supported = self._supported.get(key)
+        if supported is None:
+            supported = supported_mask(self.wave.rules, direction, mask)
+            if len(self._supported) >= SUPPORTED_CACHE_SIZE:
+                self._supported.clear()
+            self._supported[key] = supported
+
+        return supported
+
+    def propagate(self, changed: Iterable[int]) -> list[int]:
+        # returns every cell whose options shrank (so callers can update entropy), raises Contradiction if one empties
+        wave = self.wave
+        domains = wave.domains
+        neighbors = self.topology.neighbors
+        stride = self.topology.directions
+        directions = range(stride)
+        stack: list[int] = list(changed)
+        queued: set[int] = set(stack)
+        shrunk: dict[int, None] = {}
+        while stack:
+            i = stack.pop()
+            queued.discard(i)
+
+            mask = domains[i]
+            base = i * stride
+            for direction in directions:
+                neighbor_i = neighbors[base + direction]
+                if neighbor_i == NO_NEIGHBOR:
+                    continue
+
+                # a single AND against the cached union mask
+                if not wave.restrict(neighbor_i, self.supported(direction, mask)):
+                    continue
+
+                if domains[neighbor_i] == 0:
+                    raise Contradiction(neighbor_i)
+
+                shrunk[neighbor_i] = None
+                if neighbor_i not in queued:
+                    queued.add(neighbor_i)
+                    stack.append(neighbor_i)
+
+        return list(shrunk)
@@ -0,0 +1,191 @@
+from __future__ import annotations
+from typing import Callable, Iterable, Optional
+
+import random
+import time
+
+from .propagator import Contradiction
+from .rules import CompiledRules
+from .solver import BacktrackLimits, Solver
+from .topology import border_constraints
+from .wave import UNSET
+
+
+def rect_cells(top: int, left: int, rows: int, cols: int, map_rows: int, map_cols: int) -> list[int]:
+    # cells of a rectangle, clipped to the map
+    return [
+        row * map_cols + col
+        for row in range(max(0, top), min(map_rows, top + rows))
+        for col in range(max(0, left), min(map_cols, left + cols))
+    ]
+
+
+def dilate(cells: set[int], rows: int, cols: int) -> set[int]:
+    # cells plus their 4 neighbors
+    grown = set(cells)
+    for i in cells:
+        row, col = divmod(i, cols)
+        if row > 0:
+            grown.add(i - cols)
+        if row < rows - 1:
+            grown.add(i + cols)
+        if col > 0:
+            grown.add(i - 1)
+        if col < cols - 1:
+            grown.add(i + 1)
+
+    return grown
+
+
+def components(cells: set[int], cols: int, margin: int) -> list[set[int]]:
+    # cells grouped so that cells closer than 2 * margin + 2 steps (their margin-grown areas touch) share a group,
+    # groups further apart than that don't affect each other and are solved on their own
+    reach = 2 * margin + 1
+    offsets = [
+        (d_row, d_col)
+        for d_row in range(-reach, reach + 1)
+        for d_col in range(-reach, reach + 1)
+        if 0 < abs(d_row) + abs(d_col) <= reach
+    ]
+    remaining = set(cells)
+    groups: list[set[int]] = []
+    while remaining:
+        first = remaining.pop()
+        group = {first}
+        stack = [first]
+        while stack:
+            row, col = divmod(stack.pop(), cols)
+            for d_row, d_col in offsets:
+                neighbor_col = col + d_col
+                if not 0 <= neighbor_col < cols:
+                    continue
+                neighbor_i = (row + d_row) * cols + neighbor_col
+                if neighbor_i in remaining:
+                    remaining.discard(neighbor_i)
+                    group.add(neighbor_i)
+                    stack.append(neighbor_i)
+        groups.append(group)
+
+    return groups
+
+
+def _solve_region(
+        rules: CompiledRules,
+        tile: Callable[[int], int],
+        rows: int,
+        cols: int,
+        region: set[int],
+        rng: random.Random,
+        backtracking: Optional[BacktrackLimits]
+    ) -> Optional[dict[int, int]]:
+    # new tile values for the region's cells, or None if they can't be solved against the cells around them
+    # tile(i) is the current tile value of cell i. the solver only covers the region's bounding box: box cells
+    # outside the region are pinned to their tiles and box edge cells are limited by the tiles just outside the box,
+    # so the cost only depends on the region
+    top = min(i // cols for i in region)
+    bottom = max(i // cols for i in region) + 1
+    left = min(i % cols for i in region)
+    right = max(i % cols for i in region) + 1
+    height, width = bottom - top, right - left
+
+    index: dict[int, int] = {value: t for t, value in enumerate(rules.tiles)}
+
+    def outside(row: int, col: int) -> int:
+        if not (0 <= row < rows and 0 <= col < cols):
+            return UNSET
+        return index.get(tile(row * cols + col), UNSET)
+
+    constraints: list[tuple[int, int]] = []
+    for row in range(top, bottom):
+        for col in range(left, right):
+            if row * cols + col not in region:
+                t = outside(row, col)
+                if t != UNSET:
+                    constraints.append(((row - top) * width + col - left, 1 << t))
+    # edge limits on pinned cells are already met by the tiles they're pinned to, so only region cells get them
+    constraints.extend(
+        (local, mask)
+        for local, mask in border_constraints(rules.allowed, top, left, height, width, outside)
+        if (top + local // width) * cols + left + local % width in region
+    )
+
+    solver = Solver(rules, height, width, rng, backtracking)
+    try:
+        solver.constrain(constraints)
+    except Contradiction:
+        return None
+    if not solver.run():
+        return None
+
+    wave = solver.wave
+    return {i: wave.tile((i // cols - top) * width + i % cols - left) for i in region}
+
+
+# wipes the given cells of a solved map and solves only them again, against the tiles around them
+# tiles are tile values (as returned by Solver.tiles()) and are updated in place. the cells are split into groups
+# that are more than 2 * margin cells apart (see components()) and each group is solved in its own bounding box,
+# so a few scattered cells cost a few small boxes rather than one box spanning all of them.
+# a group that can't be solved against its surroundings is grown by one cell all around and tried again, up to
+# `grow` times, so a few cells around it may change too. returns every cell that was solved again,
+# raises Contradiction (at a cell of the failing group) if no attempt worked, leaving tiles untouched
+def regenerate(
+        rules: CompiledRules,
+        tiles: list[int],
+        rows: int,
+        cols: int,
+        cells: Iterable[int],
+        rng: Optional[random.Random] = None,
+        backtracking: Optional[BacktrackLimits] = BacktrackLimits(max_restarts=2),
+        grow: int = 3,
+        margin: int = 1
+    ) -> list[int]:
+    region = set(cells)
+    if not region:
+        return []
+
+    rng = rng if rng is not None else random.Random()
+    # new tiles are only written to `tiles` once every group is solved, groups solved later see the earlier ones
+    # through `changed` (a grown group can reach into one solved before it)
+    changed: dict[int, int] = {}
+    current: Callable[[int], int] = lambda i: changed.get(i, tiles[i])
+    for group in sorted(components(region, cols, margin), key=min):
+        for attempt in range(grow + 1):
+            solved = _solve_region(rules, current, rows, cols, group, rng, backtracking)
+            if solved is not None:
+                changed.update(solved)
+                break
+            if attempt < grow:
+                group = dilate(group, rows, cols)
+        else:
+            raise Contradiction(min(group))
+
+    for i, tile in changed.items():
+        tiles[i] = tile
+    return sorted(changed)
+
+
+# main entry
+def main() -> None:
+    from .ruleset import builtin_rules
+
+    # a big solved map, then a few small rectangles of it wiped and solved again
+    seed: int = 0
+    rows, cols = (256, 256)
+    rules = builtin_rules("coast")
+    start = time.perf_counter()
+    solver = Solver(rules, rows, cols, random.Random(seed), BacktrackLimits())
+    solver.run()
+    tiles = solver.tiles()
+    print(f"Solved {rows}x{cols} in {time.perf_counter() - start:.2f}s")
+
+    rng = random.Random(seed)
+    for size in (4, 8, 16, 32):
+        top, left = rng.randrange(rows - size), rng.randrange(cols - size)
+        start = time.perf_counter()
+        changed = regenerate(rules, tiles, rows, cols, rect_cells(top, left, size, size, rows, cols), rng)
+        elapsed = time.perf_counter() - start
+        print(f"Regenerated {size}x{size} at row {top}, col {left}: {len(changed)} cells in {elapsed * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+from __future__ import annotations
+from typing import Iterable, Iterator, NamedTuple, Sequence
+
+
+# rules compiled down to plain ints so the solvers never have to build or hash Connection tuples
+# tiles are referred to by their index into `tiles`, and a set of tiles is a bitmask of those indices.
+# python ints grow as needed, so a mask is effectively a multi-word bitset and there is no limit on the tile count.
+class CompiledRules(NamedTuple):
+    # tile index -> tile value (a Tiles or Tileset enum value)
+    tiles: tuple[int, ...]
+    # tile index -> weight
+    weights: tuple[float, ...]
+    # allowed[direction][tile index] -> bitmask of tiles that may sit in that direction of the tile
+    allowed: tuple[tuple[int, ...], ...]
+
+    @property
+    def full(self) -> int:
+        # mask with every tile set, a cell that hasn't been touched yet
+        return (1 << len(self.tiles)) - 1
+
+
+def compile_rules(
+        tiles: Sequence[int],
+        weights: Sequence[float],
+        connections: Iterable[tuple[int, int, int]],
+        directions: int = 4
+    ) -> CompiledRules:
+    # connections are (tile, neighbor, direction) triples, meaning neighbor may sit in direction of tile
+    index: dict[int, int] = {tile: i for i, tile in enumerate(tiles)}
+    allowed: list[list[int]] = [[0] * len(tiles) for _ in range(directions)]
+    for tile, neighbor, direction in connections:
+        allowed[direction][index[tile]] |= 1 << index[neighbor]
+
+    return CompiledRules(
+        tiles=tuple(tiles),
+        weights=tuple(weights),
+        allowed=tuple(tuple(by_tile) for by_tile in allowed),
+    )
+
+
+def iter_bits(mask: int) -> Iterator[int]:
+    # yields the tile index of every set bit, lowest first
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def supported_mask(rules: CompiledRules, direction: int, mask: int) -> int:
+    # every tile that may sit in `direction` of at least one tile in `mask`
+    allowed = rules.allowed[direction]
+    supported = 0
+    for t in iter_bits(mask):
+        supported |= allowed[t]
+
+    return supported
@@ -0,0 +1,216 @@
+from __future__ import annotations
+from typing import Any, Iterator, Mapping, Sequence
+
+import dataclasses
+import json
+import os
+
+from .cache import cached_rules, source_key
+from .rules import CompiledRules, iter_bits
+
+
+# tiled rulesets loaded from JSON or TOML files instead of being written out in code
+# a file lists its tiles by name, with the tile value (index into the tileset atlas), a weight and
+# the names of the tiles that may sit on each side of it:
+#
+#   {"name": "coast", "tiles": {"water": {"value": 42, "weight": 1.0, "up": ["water", ...], "down": [...], ...}}}
+#
+# or in TOML, one [tiles.<name>] table per tile. rulesets that ship with the package live in data/
+DATA_DIR: str = os.path.join(os.path.dirname(__file__), "data")
+DIRECTIONS: tuple[str, ...] = ("up", "down", "left", "right")
+OPPOSITE: tuple[int, ...] = (1, 0, 3, 2)
+TILE_KEYS: frozenset[str] = frozenset(("value", "weight") + DIRECTIONS)
+
+# how many asymmetric connections an error lists before giving up
+MAX_REPORTED: int = 10
+
+
+class RulesetError(ValueError):
+    pass
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class TileDef:
+    name: str
+    # position in the tile table, the bit this tile has in every mask
+    index: int
+    # tile value (a Tileset value, index into the atlas)
+    value: int
+    weight: float
+    # allowed[direction] -> bitmask of the tiles that may sit in that direction of this tile
+    allowed: tuple[int, ...]
+
+    def allows(self, direction: int, other: TileDef) -> bool:
+        return (self.allowed[direction] >> other.index) & 1 == 1
+
+
+# integer indexed tiles of a ruleset, with one frozen bitmask per tile and direction
+# checking whether two tiles may sit next to each other is a single bit test, whatever the tile count
+@dataclasses.dataclass(frozen=True, slots=True)
+class TileTable:
+    name: str
+    tiles: tuple[TileDef, ...]
+    # tile name -> tile index
+    index: Mapping[str, int]
+
+    def __len__(self) -> int:
+        return len(self.tiles)
+
+    def __iter__(self) -> Iterator[TileDef]:
+        return iter(self.tiles)
+
+    def __getitem__(self, name: str) -> TileDef:
+        return self.tiles[self.index[name]]
+
+    def allows(self, tile: int, direction: int, other: int) -> bool:
+        # whether tile index `other` may sit in `direction` of tile index `tile`
+        return (self.tiles[tile].allowed[direction] >> other) & 1 == 1
+
+    def neighbors(self, tile: int, direction: int) -> list[TileDef]:
+        return [self.tiles[t] for t in iter_bits(self.tiles[tile].allowed[direction])]
+
+    def rules(self) -> CompiledRules:
+        # the masks already are what the solvers use, so this only regroups them by direction
+        return CompiledRules(
+            tiles=tuple(tile.value for tile in self.tiles),
+            weights=tuple(tile.weight for tile in self.tiles),
+            allowed=tuple(tuple(tile.allowed[d] for tile in self.tiles) for d in range(len(DIRECTIONS))),
+        )
+
+
+def asymmetries(allowed: Sequence[Sequence[int]]) -> Iterator[tuple[int, int, int]]:
+    # (tile, direction, neighbor) for every neighbor allowed in direction of tile whose own rules don't allow tile
+    # back in the opposite direction, e.g. B is right of A but A isn't left of B
+    for direction, by_tile in enumerate(allowed):
+        back = allowed[OPPOSITE[direction]]
+        for tile, mask in enumerate(by_tile):
+            for neighbor in iter_bits(mask):
+                if not (back[neighbor] >> tile) & 1:
+                    yield tile, direction, neighbor
+
+
+def parse_ruleset(data: Mapping[str, Any], name: str = "ruleset") -> TileTable:
+    # raises RulesetError for malformed rulesets and for connections that only go one way
+    name = data.get("name", name)
+    tiles = data.get("tiles")
+    if not isinstance(tiles, Mapping) or not tiles:
+        raise RulesetError(f"{name}: expected a non-empty 'tiles' table")
+
+    index: dict[str, int] = {tile_name: i for i, tile_name in enumerate(tiles)}
+    values: set[int] = set()
+    defs: list[tuple[str, int, float]] = []
+    allowed: list[list[int]] = [[0] * len(tiles) for _ in DIRECTIONS]
+    for i, (tile_name, tile) in enumerate(tiles.items()):
+        if not isinstance(tile, Mapping):
+            raise RulesetError(f"{name}: tile {tile_name!r} must be a table")
+        unknown = set(tile) - TILE_KEYS
+        if unknown:
+            raise RulesetError(f"{name}: tile {tile_name!r} has unknown keys {', '.join(sorted(unknown))}")
+
+        value = tile.get("value")
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise RulesetError(f"{name}: tile {tile_name!r} needs a non-negative integer 'value'")
+        if value in values:
+            raise RulesetError(f"{name}: tile {tile_name!r} reuses value {value}")
+        values.add(value)
+
+        weight = tile.get("weight", 1.0)
+        if not isinstance(weight, (int, float)) or isinstance(weight, bool) or weight <= 0:
+            raise RulesetError(f"{name}: tile {tile_name!r} needs a positive 'weight'")
+        defs.append((tile_name, value, float(weight)))
+
+        for direction, key in enumerate(DIRECTIONS):
+            mask = 0
+            for neighbor in tile.get(key, ()):
+                t = index.get(neighbor)
+                if t is None:
+                    raise RulesetError(f"{name}: tile {tile_name!r} lists unknown tile {neighbor!r} {key}")
+                mask |= 1 << t
+            allowed[direction][i] = mask
+
+    names = list(index)
+    broken = [
+        f"{names[neighbor]} is {DIRECTIONS[direction]} of {names[tile]}, "
+        f"but {names[tile]} isn't {DIRECTIONS[OPPOSITE[direction]]} of {names[neighbor]}"
+        for tile, direction, neighbor in asymmetries(allowed)
+    ]
+    if broken:
+        shown = "\n  ".join(broken[:MAX_REPORTED])
+        more = f"\n  ... and {len(broken) - MAX_REPORTED} more" if len(broken) > MAX_REPORTED else ""
+        raise RulesetError(f"{name}: {len(broken)} one-way connections\n  {shown}{more}")
+
+    return TileTable(
+        name=name,
+        tiles=tuple(
+            TileDef(tile_name, i, value, weight, tuple(by_tile[i] for by_tile in allowed))
+            for i, (tile_name, value, weight) in enumerate(defs)
+        ),
+        index=index,
+    )
+
+
+def parse_ruleset_bytes(data: bytes, name: str, format: str) -> TileTable:
+    # format is "json" or "toml", tomllib is only imported for TOML files to keep startup cheap
+    errors: tuple[type[Exception], ...] = (json.JSONDecodeError, UnicodeDecodeError)
+    if format == "toml":
+        import tomllib
+        errors += (tomllib.TOMLDecodeError,)
+
+    try:
+        if format == "json":
+            parsed = json.loads(data)
+        elif format == "toml":
+            parsed = tomllib.loads(data.decode())
+        else:
+            raise RulesetError(f"{name}: unknown ruleset format {format!r}, expected json or toml")
+    except errors as error:
+        raise RulesetError(f"{name}: {error}") from error
+
+    if not isinstance(parsed, dict):
+        raise RulesetError(f"{name}: expected a table at the top level")
+    return parse_ruleset(parsed, name)
+
+
+def _format(path: str) -> str:
+    return os.path.splitext(path)[1].lstrip(".").lower()
+
+
+def load_ruleset(path: str) -> TileTable:
+    name = os.path.splitext(os.path.basename(path))[0]
+    with open(path, "rb") as file:
+        return parse_ruleset_bytes(file.read(), name, _format(path))
+
+
+def builtin_rulesets() -> list[str]:
+    # names of the rulesets in data/
+    return sorted(os.path.splitext(entry)[0] for entry in os.listdir(DATA_DIR) if _format(entry) in ("json", "toml"))
+
+
+def _builtin_source(name: str) -> tuple[bytes, str]:
+    for format in ("json", "toml"):
+        path = os.path.join(DATA_DIR, f"{name}.{format}")
+        if os.path.isfile(path):
+            with open(path, "rb") as file:
+                return file.read(), format
+
+    raise RulesetError(f"unknown ruleset {name!r}, expected one of {', '.join(builtin_rulesets())}")
+
+
+def builtin_ruleset(name: str) -> TileTable:
+    data, format = _builtin_source(name)
+    return parse_ruleset_bytes(data, name, format)
+
+
+def ruleset_rules(path: str, use_cache: bool = True) -> CompiledRules:
+    # compiled rules of a ruleset file, keyed in the rules cache by the file's contents
+    with open(path, "rb") as file:
+        data = file.read()
+    name = os.path.splitext(os.path.basename(path))[0]
+    build = lambda: parse_ruleset_bytes(data, name, _format(path)).rules()
+    return cached_rules(source_key("ruleset", data), build) if use_cache else build()
+
+
+def builtin_rules(name: str, use_cache: bool = True) -> CompiledRules:
+    data, format = _builtin_source(name)
+    build = lambda: parse_ruleset_bytes(data, name, format).rules()
+    return cached_rules(source_key("ruleset", data), build) if use_cache else build()
@@ -0,0 +1,96 @@
+from __future__ import annotations
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import accumulate
+from typing import NamedTuple, Sequence
+
+import random
+import time
+
+from .rules import iter_bits
+
+
+# domains with at most this many tiles are quicker to walk bit by bit than to look up (see Wave.choose)
+WALK_TILES: int = 8
+# tables kept per sampler, each one costs 12 bytes per tile in its domain
+DEFAULT_CACHE_SIZE: int = 1024
+
+
+class SamplingTable(NamedTuple):
+    # tile indices of the domain, lowest first
+    tiles: array[int]
+    # cumulative[k] -> sum of the weights of tiles[0..k]
+    cumulative: array[float]
+
+
+# weighted pick of one tile out of a domain (a bitmask of tile indices, see wave.py)
+# a cell's domain is usually one of a handful of option sets that keep coming back, so the cumulative weights
+# of each domain are built once and kept in an LRU, and picking a tile from a domain seen before is a
+# binary search (O(log T)) that doesn't allocate, instead of a walk over every set bit of the mask
+class WeightedSampler:
+    def __init__(self, weights: Sequence[float], cache_size: int = DEFAULT_CACHE_SIZE) -> None:
+        self.weights: tuple[float, ...] = tuple(weights)
+        self.cache_size = cache_size
+        # domain mask -> table, least recently used first
+        self._tables: OrderedDict[int, SamplingTable] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def table(self, mask: int) -> SamplingTable:
+        table = self._tables.get(mask)
+        if table is not None:
+            self.hits += 1
+            self._tables.move_to_end(mask)
+            return table
+
+        self.misses += 1
+        tiles = array("i", iter_bits(mask))
+        weights = self.weights
+        table = SamplingTable(tiles, array("d", accumulate(weights[t] for t in tiles)))
+        self._tables[mask] = table
+        while len(self._tables) > self.cache_size:
+            self._tables.popitem(last=False)
+
+        return table
+
+    def choose(self, mask: int, rng: random.Random) -> int:
+        # mask can't be empty. a tile is picked when r falls below its cumulative weight, so zero weight tiles
+        # never are, and min() covers r landing right on the total through float rounding
+        tiles, cumulative = self.table(mask)
+        r = rng.random() * cumulative[-1]
+        return tiles[min(bisect_right(cumulative, r), len(tiles) - 1)]
+
+
+# main entry
+def main() -> None:
+    # picks from a few recurring domains of a large tileset, walking the bits vs the cached tables
+    seed: int = 0
+    tile_count: int = 512
+    rng = random.Random(seed)
+    weights = [rng.uniform(0.1, 2.0) for _ in range(tile_count)]
+    full = (1 << tile_count) - 1
+    domains = [full & ~rng.getrandbits(tile_count) for _ in range(32)]
+    picks = 20_000
+
+    def walk(mask: int) -> int:
+        r = rng.random() * sum(weights[t] for t in iter_bits(mask))
+        t = 0
+        for t in iter_bits(mask):
+            r -= weights[t]
+            if r < 0:
+                break
+        return t
+
+    sampler = WeightedSampler(weights)
+    for name, choose in (("walk", walk), ("table", lambda mask: sampler.choose(mask, rng))):
+        start = time.perf_counter()
+        for n in range(picks):
+            choose(domains[n % len(domains)])
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {picks / elapsed:.0f} picks/sec over {len(domains)} domains of ~{tile_count // 2} tiles")
+    print(f"{sampler.hits} table hits, {sampler.misses} misses")
+
+
+if __name__ == "__main__":
+    main()
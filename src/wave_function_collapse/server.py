@@ -0,0 +1,273 @@
+from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Awaitable, BinaryIO, Callable, NamedTuple, Optional, Sequence
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from .generate import RULESETS, MapJob, MapResult, compile_ruleset, solve_map
+from .rules import CompiledRules
+from .solver import BacktrackLimits
+
+
+# requests bigger than this are refused, so one request can't tie a worker up for minutes
+MAX_CELLS: int = 1024 * 1024
+# cells of finished maps kept in the result cache, a cached cell costs about 8 bytes (a list slot per tile)
+DEFAULT_CACHE_CELLS: int = 4 * MAX_CELLS
+
+
+class MapKey(NamedTuple):
+    ruleset: str
+    rows: int
+    cols: int
+    seed: int
+    backtrack: bool
+
+
+class ServerStats(NamedTuple):
+    requests: int
+    # served from the result cache
+    hits: int
+    # joined a solve that was already running for the same map
+    coalesced: int
+    solves: int
+
+
+# compiled rules per worker process, compiled (or loaded from the rules cache) the first time a ruleset is asked for
+_worker_rules: dict[str, CompiledRules] = {}
+
+def _solve_key(key: MapKey) -> MapResult:
+    rules = _worker_rules.get(key.ruleset)
+    if rules is None:
+        rules = _worker_rules[key.ruleset] = compile_ruleset(key.ruleset)
+
+    backtracking = BacktrackLimits() if key.backtrack else None
+    return solve_map(rules, MapJob(key.seed, key.rows, key.cols, backtracking))
+
+
+def parse_request(request: Any) -> MapKey:
+    # raises ValueError for anything that isn't a valid map request
+    if not isinstance(request, dict):
+        raise ValueError("request must be a JSON object")
+
+    ruleset = request.get("ruleset", "simpler")
+    if ruleset not in RULESETS:
+        raise ValueError(f"unknown ruleset {ruleset!r}, expected one of {', '.join(RULESETS)}")
+
+    values: list[int] = []
+    for field in ("width", "height", "seed"):
+        value = request.get(field)
+        if not isinstance(value, int) or isinstance(value, bool):
+            raise ValueError(f"{field} must be an integer")
+        values.append(value)
+    width, height, seed = values
+
+    if width <= 0 or height <= 0 or width * height > MAX_CELLS:
+        raise ValueError(f"width and height must be positive, with at most {MAX_CELLS} cells")
+
+    return MapKey(ruleset, height, width, seed, bool(request.get("backtrack", False)))
+
+
+async def feed_lines(reader: asyncio.StreamReader, stream: BinaryIO) -> None:
+    # reads stream line by line on the default thread pool, so the event loop keeps running between lines
+    loop = asyncio.get_running_loop()
+    try:
+        while line := await loop.run_in_executor(None, stream.readline):
+            reader.feed_data(line)
+    finally:
+        reader.feed_eof()
+
+
+# long-lived map generation server, speaking JSON lines over stdio or a local socket
+# every request line is a JSON object {"id": ..., "ruleset": "simpler", "width": 48, "height": 32, "seed": 0},
+# answered by one line with the same id and either the tiles (row by row) or an "error". requests are handled
+# concurrently and answered as they finish, so answers can come back out of order.
+# solves run in a process pool, requests for a map that is already being solved wait on that solve instead of
+# starting another one, and finished maps are kept in an LRU cache so repeated requests are answered right away.
+# the cache is bounded by the total cells of the maps in it rather than their number, since a single map can be
+# anywhere from a few cells to MAX_CELLS
+class MapServer:
+    def __init__(self, workers: Optional[int] = None, cache_cells: int = DEFAULT_CACHE_CELLS, executor: Optional[Executor] = None) -> None:
+        self.executor: Executor = executor if executor is not None else ProcessPoolExecutor(max_workers=workers)
+        self.cache_cells = cache_cells
+        self.cache: OrderedDict[MapKey, MapResult] = OrderedDict()
+        # total cells of the maps in cache
+        self.cached_cells: int = 0
+        self.in_flight: dict[MapKey, asyncio.Task[MapResult]] = {}
+
+        self.requests: int = 0
+        self.hits: int = 0
+        self.coalesced: int = 0
+        self.solves: int = 0
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
+
+    def stats(self) -> ServerStats:
+        return ServerStats(self.requests, self.hits, self.coalesced, self.solves)
+
+    async def generate(self, key: MapKey) -> tuple[MapResult, str]:
+        # the map and where it came from ("cache", "coalesced" or "solved")
+        self.requests += 1
+        result = self.cache.get(key)
+        if result is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return result, "cache"
+
+        task = self.in_flight.get(key)
+        source = "coalesced"
+        if task is None:
+            task = self.in_flight[key] = asyncio.ensure_future(self._solve(key))
+            source = "solved"
+        else:
+            self.coalesced += 1
+
+        # shielded, so a client that goes away doesn't cancel the solve for everyone else waiting on it
+        return await asyncio.shield(task), source
+
+    async def _solve(self, key: MapKey) -> MapResult:
+        self.solves += 1
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.executor, _solve_key, key)
+        finally:
+            del self.in_flight[key]
+
+        # a map bigger than the whole cache isn't kept, it would only push everything else out
+        cells = len(result.tiles)
+        if cells <= self.cache_cells:
+            self.cache[key] = result
+            self.cached_cells += cells
+            while self.cached_cells > self.cache_cells:
+                _, evicted = self.cache.popitem(last=False)
+                self.cached_cells -= len(evicted.tiles)
+
+        return result
+
+    async def respond(self, line: bytes) -> dict[str, Any]:
+        request_id: Any = None
+        try:
+            request = json.loads(line)
+            if isinstance(request, dict):
+                request_id = request.get("id")
+            key = parse_request(request)
+        except ValueError as error:
+            return {"id": request_id, "error": str(error)}
+
+        # a failed solve (a ruleset that doesn't compile, a worker that died) is answered like any other bad
+        # request, it mustn't leave the request unanswered or take the other requests down with it
+        start = time.perf_counter()
+        try:
+            result, source = await self.generate(key)
+        except Exception as error:
+            return {"id": request_id, "error": f"solve failed: {type(error).__name__}: {error}"}
+
+        return {
+            "id": request_id,
+            "ruleset": key.ruleset,
+            "width": key.cols,
+            "height": key.rows,
+            "seed": key.seed,
+            "tiles": result.tiles,
+            "contradiction": result.contradiction,
+            "source": source,
+            "elapsed": time.perf_counter() - start,
+        }
+
+    async def serve(self, reader: asyncio.StreamReader, send: Callable[[bytes], Awaitable[None]]) -> None:
+        # answers every request line from reader until it hits EOF
+        pending: set[asyncio.Task[None]] = set()
+
+        async def answer(line: bytes) -> None:
+            response = await self.respond(line)
+            await send(json.dumps(response, separators=(",", ":")).encode() + b"\n")
+
+        while line := await reader.readline():
+            if not line.strip():
+                continue
+            task = asyncio.create_task(answer(line))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        if pending:
+            await asyncio.gather(*pending)
+
+    async def serve_stdio(self) -> None:
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        feeding: Optional[asyncio.Task[None]] = None
+        try:
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        except ValueError:
+            # stdin is a regular file (`< requests.jsonl`), which can't be watched by the event loop,
+            # so its lines are read on a thread and fed to the reader instead
+            feeding = asyncio.create_task(feed_lines(reader, sys.stdin.buffer))
+
+        async def send(data: bytes) -> None:
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+
+        try:
+            await self.serve(reader, send)
+        finally:
+            if feeding is not None:
+                feeding.cancel()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        async def send(data: bytes) -> None:
+            writer.write(data)
+            await writer.drain()
+
+        try:
+            await self.serve(reader, send)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(server: MapServer, socket_path: Optional[str] = None, port: Optional[int] = None) -> None:
+    if socket_path is not None:
+        listener = await asyncio.start_unix_server(server.handle_connection, socket_path)
+    elif port is not None:
+        listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", port)
+    else:
+        await server.serve_stdio()
+        return
+
+    async with listener:
+        await listener.serve_forever()
+
+
+# main entry
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve maps over JSON lines, on stdio by default.")
+    parser.add_argument("--socket", default=None, help="listen on this unix socket instead of stdio")
+    parser.add_argument("--port", type=int, default=None, help="listen on this localhost TCP port instead of stdio")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (defaults to the CPU count)")
+    parser.add_argument(
+        "--cache-cells",
+        type=int,
+        default=DEFAULT_CACHE_CELLS,
+        help="total cells of the finished maps kept around for repeated requests",
+    )
+    args = parser.parse_args(argv)
+
+    server = MapServer(args.workers, args.cache_cells)
+    try:
+        asyncio.run(serve(server, args.socket, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        requests, hits, coalesced, solves = server.stats()
+        print(f"{requests} requests, {hits} cache hits, {coalesced} coalesced, {solves} solves", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
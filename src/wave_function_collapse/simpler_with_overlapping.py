@@ -1,8 +1,16 @@
 from __future__ import annotations
+from collections import Counter
 from enum import IntEnum
-from typing import NamedTuple, Optional
+from itertools import islice, repeat
+from typing import Iterable, NamedTuple, Optional, Sequence
 
-import random
+import sys
+
+from .rules import CompiledRules, compile_rules
+from .solver import Solver
+from .terminal import TerminalRenderer, background
+from .topology import NO_NEIGHBOR, Topology, grid
+from .wave import Wave
  
 
 # can't forward declare this, sorry
@@ -17,6 +25,25 @@ class Tiles(IntEnum):
 MAP_HEIGHT: int = 32
 MAP_WIDTH: int = 48
 
+# ANSI background color of each tile when rendered to the terminal
+PALETTE: dict[Tiles, str] = {
+    Tiles.SEA: background(44),
+    Tiles.COAST: background(43),
+    Tiles.LAND: background(42),
+}
+
+# sample tilemap the rules are learned from
+SAMPLE_MAP_ROWS: int = 6
+SAMPLE_MAP_COLS: int = 6
+SAMPLE_MAP: list[Tiles] = [
+    Tiles.LAND, Tiles.LAND, Tiles.LAND, Tiles.LAND, Tiles.LAND, Tiles.LAND,
+    Tiles.LAND, Tiles.COAST, Tiles.COAST, Tiles.COAST, Tiles.LAND, Tiles.LAND,
+    Tiles.LAND, Tiles.COAST, Tiles.SEA, Tiles.SEA, Tiles.COAST, Tiles.LAND,
+    Tiles.LAND, Tiles.COAST, Tiles.SEA, Tiles.SEA, Tiles.COAST, Tiles.LAND,
+    Tiles.LAND, Tiles.LAND, Tiles.COAST, Tiles.COAST, Tiles.LAND, Tiles.LAND,
+    Tiles.LAND, Tiles.LAND, Tiles.LAND, Tiles.LAND, Tiles.LAND, Tiles.LAND,
+]
+
 
 # helpful types and enums
 class Directions(IntEnum):
@@ -40,114 +67,127 @@ class Neighbors(NamedTuple):
 
 
 # functions
-def find_lowest_entropy(map: list[list[Tiles]]) -> list[int]:
-    # find lowest length (entropy heuristic)
-    lowest_length: Optional[int] = None
-    lowest_indices: list[int] = []
-    for i, options in enumerate(map):
-        options_len: int = len(options)
-        if options_len == 1:
-            continue
-
-        if lowest_length is None or options_len < lowest_length:
-            # first or new lowest, clear accumulated and add new lowest
-            lowest_length = options_len
-            lowest_indices.clear()
-            lowest_indices.append(i)
-        elif options_len == lowest_length:
-            lowest_indices.append(i)
-
-    # return list of indices into map with lowest entropy
-    return lowest_indices
-
 def get_neighbors(i: int, rows: int, cols: int) -> Neighbors:
-    row, col = divmod(i, cols)
-
-    up: Optional[int] = (row - 1) * cols + col if row > 0 else None
-    down: Optional[int] = (row + 1) * cols + col if row < rows - 1 else None
-    left: Optional[int] = row * cols + (col - 1) if col > 0 else None
-    right: Optional[int] = row * cols + (col + 1) if col < cols - 1 else None
-
-    return Neighbors(
-        up=up,
-        down=down,
-        left=left,
-        right=right
-    )
-
-def analyze_map(map: list[Tiles], rows: int, cols: int) -> set[Connection]:
-    all_connection_constraints: list[tuple[Tiles, Tiles, Directions]] = []
-    for i, tile in enumerate(map):
-        up_i, down_i, left_i, right_i = get_neighbors(i, rows, cols)
-        
-        if up_i is not None:
-            conn: tuple[Tiles, Tiles, Directions] = (map[up_i], tile, Directions.UP)
-            all_connection_constraints.append(conn)
-
-        if down_i is not None:
-            conn = (map[down_i], tile, Directions.DOWN)
-            all_connection_constraints.append(conn)
-
-        if left_i is not None:
-            conn = (map[left_i], tile, Directions.LEFT)
-            all_connection_constraints.append(conn)
-
-        if right_i is not None:
-            conn = (map[right_i], tile, Directions.RIGHT)
-            all_connection_constraints.append(conn)
-    
-    connections: set[Connection] = set([])
-    check_conns: set[tuple[Tiles, Tiles, Directions]] = set(all_connection_constraints)
-    for i, temp_conn in enumerate(check_conns):
-        weight: int = all_connection_constraints.count(temp_conn)
-        connection: Connection = Connection(
-            *temp_conn,
-            weight
+    # looked up in the grid's precomputed neighbor table (see topology.py)
+    return Neighbors(*(None if n == NO_NEIGHBOR else n for n in grid(rows, cols).neighbors_of(i)))
+
+class SampleAnalyzer:
+    # learns connections from a sample map in a single counting pass
+    # rows are fed one at a time and only the previous row is kept around, so a huge sample can be streamed in
+    # (from a file, a generator, ...) instead of being built as one list of Tiles first.
+    # each row is a sequence of tile values (a list of Tiles, bytes, an array, ...)
+    def __init__(self) -> None:
+        # (tile, connects_to, from_dir) -> times tile was found in from_dir of connects_to
+        self.counts: Counter[tuple[int, int, int]] = Counter()
+        # tile -> times it appears in the sample
+        self.tile_counts: Counter[int] = Counter()
+        self.rows: int = 0
+        self._previous: Optional[Sequence[int]] = None
+
+    def feed(self, row: Sequence[int]) -> None:
+        previous = self._previous
+        if previous is not None and len(row) != len(previous):
+            raise ValueError(f"sample row {self.rows} has {len(row)} tiles, expected {len(previous)}")
+
+        # Counter.update walks the zipped (shifted) rows in C, so nothing is done per tile in python
+        counts = self.counts
+        self.tile_counts.update(row)
+        counts.update(zip(row[1:], row, repeat(Directions.RIGHT)))
+        counts.update(zip(row, row[1:], repeat(Directions.LEFT)))
+        if previous is not None:
+            counts.update(zip(row, previous, repeat(Directions.DOWN)))
+            counts.update(zip(previous, row, repeat(Directions.UP)))
+
+        self._previous = row
+        self.rows += 1
+
+    def feed_rows(self, rows: Iterable[Sequence[int]]) -> None:
+        for row in rows:
+            self.feed(row)
+
+    def feed_tiles(self, tiles: Iterable[int], cols: int) -> None:
+        # a flat stream of tiles, cut into rows of `cols` tiles
+        it = iter(tiles)
+        for row in iter(lambda: list(islice(it, cols)), []):
+            self.feed(row)
+
+    def feed_cells(self, tiles: Sequence[int], topology: Topology) -> None:
+        # a whole sample laid out on any topology (wrapping, hex, voxel, see topology.py), instead of row by row.
+        # the neighbor table holds, for each direction, every cell's neighbor in that direction, so each direction
+        # is counted with one Counter.update over a strided slice of it. NO_NEIGHBOR (-1) picks up the None
+        # appended to the tiles, and those pairs are left out when the counts are added to the analyzer's
+        if len(tiles) != topology.size:
+            raise ValueError(f"sample has {len(tiles)} tiles, the {topology.kind} topology has {topology.size} cells")
+
+        pairs: Counter[tuple[Optional[int], int, int]] = Counter()
+        padded: list[Optional[int]] = [*tiles, None]
+        self.tile_counts.update(tiles)
+        for direction in range(topology.directions):
+            column = topology.neighbors[direction::topology.directions]
+            pairs.update(zip(map(padded.__getitem__, column), tiles, repeat(direction)))
+        self.counts.update({(a, b, d): count for (a, b, d), count in pairs.items() if a is not None})
+        self.rows += topology.rows
+
+    def rules(self, directions: int = 4) -> CompiledRules:
+        # rules straight from the counts, for samples with more than 4 directions (hex and voxel topologies)
+        # that don't fit a Connection. weights are worked out the same way as in compile_connections()
+        tiles = sorted(self.tile_counts)
+        weights: Counter[int] = Counter()
+        for (tile, _, _), count in self.counts.items():
+            weights[tile] += count
+
+        return compile_rules(
+            tiles,
+            [weights[t] or 1e-3 for t in tiles],
+            ((connects_to, tile, from_dir) for tile, connects_to, from_dir in self.counts),
+            directions,
         )
-        connections.add(connection)
 
-    return connections
-
-def render_map(rows: int, cols: int, map: list[list[Tiles]] | list[Tiles]):
-    for row in range(rows):
-        for col in range(cols):
-            i: int = (row * cols) + col
-
-            if isinstance(map[i], Tiles):
-                tile: Tiles = map[i]  # type: ignore
-            else:
-                tile: Tiles = map[i][0] if len(map[i]) == 1 else Tiles.UNSET  # type: ignore
+    def connections(self) -> set[Connection]:
+        return set(
+            Connection(Tiles(tile), Tiles(connects_to), Directions(from_dir), weight)
+            for (tile, connects_to, from_dir), weight in self.counts.items()
+        )
 
-            colored_tile: str = ""
-            tile_str: str = "   "
-            match tile:
-                case Tiles.SEA:
-                    colored_tile = f"\x1b[44m{tile_str}\x1b[0m"
-                case Tiles.COAST:
-                    colored_tile = f"\x1b[43m{tile_str}\x1b[0m"
-                case Tiles.LAND:
-                    colored_tile = f"\x1b[42m{tile_str}\x1b[0m"
-                case _:  # type: ignore
-                    colored_tile = "\x1b[37m \N{BULLET} \x1b[0m"
+def analyze_map(map: Sequence[Tiles], rows: int, cols: int) -> set[Connection]:
+    analyzer = SampleAnalyzer()
+    analyzer.feed_rows(map[row * cols:(row + 1) * cols] for row in range(rows))
+    return analyzer.connections()
+
+def analyze_rows(rows: Iterable[Sequence[int]]) -> set[Connection]:
+    analyzer = SampleAnalyzer()
+    analyzer.feed_rows(rows)
+    return analyzer.connections()
+
+def compile_connections(connections: set[Connection]) -> CompiledRules:
+    # analyze_map records Connection(tile, connects_to, from_dir) when tile was found in from_dir of connects_to
+    # a tile's weight is how often it was found next to another tile, which is proportional to how often it shows up
+    # in the sample (edge tiles count a little less). tiles that never show up get a tiny weight instead of 0
+    tiles: list[Tiles] = [t for t in Tiles if t != Tiles.UNSET]
+    counts: dict[Tiles, float] = {t: 0.0 for t in tiles}
+    for conn in connections:
+        counts[conn.tile] += conn.weight
+
+    return compile_rules(
+        tiles,
+        [counts[t] or 1e-3 for t in tiles],
+        ((conn.connects_to, conn.tile, conn.from_dir) for conn in connections),
+    )
 
-            print(colored_tile, end="")
-        print(end="\n")
+def render_map(rows: int, cols: int, map: Wave | list[Tiles]):
+    # the whole map is built as one buffer and written at once (see terminal.py)
+    tiles: list[int] = map.tiles() if isinstance(map, Wave) else list(map)
+    sys.stdout.flush()
+    TerminalRenderer(rows, cols, PALETTE).draw(tiles)
 
 
 # main entry
 def main() -> None:
     # simplified WFC algorithm
-    # create a sample tilemap
-    sample_map_rows: int = 6
-    sample_map_cols: int = 6
-    sample_map: list[Tiles] = [
-        Tiles.LAND, Tiles.LAND, Tiles.LAND, Tiles.LAND, Tiles.LAND, Tiles.LAND,
-        Tiles.LAND, Tiles.COAST, Tiles.COAST, Tiles.COAST, Tiles.LAND, Tiles.LAND,
-        Tiles.LAND, Tiles.COAST, Tiles.SEA, Tiles.SEA, Tiles.COAST, Tiles.LAND,
-        Tiles.LAND, Tiles.COAST, Tiles.SEA, Tiles.SEA, Tiles.COAST, Tiles.LAND,
-        Tiles.LAND, Tiles.LAND, Tiles.COAST, Tiles.COAST, Tiles.LAND, Tiles.LAND,
-        Tiles.LAND, Tiles.LAND, Tiles.LAND, Tiles.LAND, Tiles.LAND, Tiles.LAND,
-    ]
+    # create a sample tilemap (see SAMPLE_MAP)
+    sample_map_rows: int = SAMPLE_MAP_ROWS
+    sample_map_cols: int = SAMPLE_MAP_COLS
+    sample_map: list[Tiles] = SAMPLE_MAP
     print("Sample Map")
     render_map(sample_map_rows, sample_map_cols, sample_map)
     print(end="\n")
@@ -155,46 +195,17 @@ def main() -> None:
     # analyze map to discover connection constraints and weights
     connections = analyze_map(sample_map, sample_map_rows, sample_map_cols)
 
-    # create tilemap with "super-positioned" cells
+    # simplified WFC algorithm (see solver.py)
     rows: int = MAP_HEIGHT
     cols: int = MAP_WIDTH
-    map: list[list[Tiles]] = []
-    for _ in range(rows * cols):
-        map.append([Tiles.SEA, Tiles.COAST, Tiles.LAND])
-
-    for _ in range(rows * cols):
-        # return set of lowest entropy
-        # since each element of our map grid is a list of possible tiles, the entropy heuristic is just the length of possible tiles
-        # this can be modified for better results, i think "Shannon entropy" is what is used in actual WFC implementations
-        lowest: list[int] = find_lowest_entropy(map)
-        if len(lowest) == 0:
-            break
-        
-        i: int = random.choice(lowest)
-
-        # collapse
-        # get the weights of the remaining possible tiles
-        # place a tile
-        tile: Tiles = Tiles(random.choice(map[i]))
-        map[i] = [tile]
-
-        # propagate (for each neighbor, remove tiles that don't conform to placed tile rule)
-        up_i, down_i, left_i, right_i = get_neighbors(i, rows, cols)
-
-        # apply rules to each neighbor, removing tiles that violate the connection constraints
-        dirs = list(Directions)
-        for i, neighbor_i in enumerate([up_i, down_i, left_i, right_i]):
-            if neighbor_i is not None:
-                for t in map[neighbor_i][:]:
-                    check_connection: Optional[Connection] = next(iter(x for x in connections if x.tile == t and x.connects_to == tile and x.from_dir == dirs[i]), None)
-                    # had to add safeguard to avoid removing all possibilities from the cell. maybe this can be fixed, but I don't know how to at the moment.
-                    # this results in slightly inaccurate representations, where a cell may violate a rule. I'm okay with this for now..
-                    if check_connection is None and len(map[neighbor_i]) > 1:
-                        map[neighbor_i].remove(t)
+    solver: Solver = Solver(compile_connections(connections), rows, cols)
+    if not solver.run() and solver.contradiction is not None:
+        row, col = divmod(solver.contradiction, cols)
+        print(f"Contradiction at row {row}, col {col}")
 
     # render
     print("Generated Map")
-    render_map(rows, cols, map)
+    render_map(rows, cols, solver.wave)
 
 
 if __name__ == "__main__":
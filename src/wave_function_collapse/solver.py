@@ -0,0 +1,284 @@
+from __future__ import annotations
+from collections import deque
+from typing import Iterable, NamedTuple, Optional
+
+import dataclasses
+import math
+import random
+import time
+
+from .entropy import EntropyHeap, Heuristic
+from .propagator import Contradiction, Propagator
+from .rules import CompiledRules
+from .topology import Topology, grid
+from .wave import Wave
+
+
+class BacktrackLimits(NamedTuple):
+    # decisions kept around to backtrack into, older ones are forgotten
+    max_depth: int = 1_000
+    # changes kept on the undo trail (each one is a (cell, domain, weight sums) tuple), older decisions are forgotten past this
+    max_trail: int = 1_000_000
+    # times the whole map may be started over once backtracking runs out of decisions (or of max_backtracks)
+    max_restarts: int = 10
+    # decisions undone per attempt before starting over, a deep stack can otherwise keep backtracking for good
+    max_backtracks: int = 1_000
+
+
+class Decision(NamedTuple):
+    # cell that was collapsed, the tile index it was collapsed to, and the trail position right before it
+    i: int
+    tile: int
+    mark: int
+
+
+class Progress(NamedTuple):
+    # cells that don't have a choice left to make (collapsed, or narrowed down to one tile by propagation)
+    collapsed: int
+    # cells still waiting in the entropy heap
+    remaining: int
+    # solved or stopped by a contradiction, see Solver.contradiction
+    done: bool
+
+
+@dataclasses.dataclass
+class SolverStats:
+    contradictions: int = 0
+    backtracks: int = 0
+    restarts: int = 0
+    # decisions dropped because of the depth or trail limits
+    forgotten: int = 0
+
+
+# simplified WFC algorithm, shared by every model
+# the models only differ in how their rules are made (hand-written or analyzed from a sample),
+# once compiled the find lowest entropy -> collapse -> propagate loop is the same
+class Solver:
+    def __init__(
+            self,
+            rules: CompiledRules,
+            rows: int,
+            cols: int,
+            rng: Optional[random.Random] = None,
+            backtracking: Optional[BacktrackLimits] = None,
+            heuristic: Heuristic = Heuristic.COUNT,
+            topology: Optional[Topology] = None
+        ) -> None:
+        self.rules = rules
+        self.rows = rows
+        self.cols = cols
+        # a bounded square grid by default, the topology's cells are numbered in a rows x cols layout
+        # (see topology.py, voxel layers are stacked on top of each other)
+        self.topology: Topology = topology if topology is not None else grid(rows, cols)
+        if self.topology.size != rows * cols:
+            raise ValueError(f"{self.topology.kind} topology of shape {self.topology.shape} doesn't have {rows}x{cols} cells")
+        if len(rules.allowed) != self.topology.directions:
+            raise ValueError(f"rules have {len(rules.allowed)} directions, the {self.topology.kind} topology has {self.topology.directions}")
+        self.rng: random.Random = rng if rng is not None else random.Random()
+        self.backtracking = backtracking
+        self.heuristic = heuristic
+        self.stats: SolverStats = SolverStats()
+        # (cell, mask) limits applied before solving, see constrain()
+        self.constraints: list[tuple[int, int]] = []
+        # cells whose options changed since the last take_changed(), None until track_changes() is called
+        self.changed: Optional[set[int]] = None
+        # set once run() or run_until() finish the map (or hit a contradiction)
+        self.done: bool = False
+
+        self.reset()
+
+        # cell that ran out of tiles, if any
+        self.contradiction: Optional[int] = None
+
+    def reset(self) -> None:
+        # create tilemap with "super-positioned" cells
+        self.wave: Wave = Wave(self.rows * self.cols, self.rules)
+        self.propagator: Propagator = Propagator(self.wave, self.topology)
+
+        # every cell starts with the same entropy, cells are pushed again whenever propagation shrinks them
+        self.heap: EntropyHeap = EntropyHeap(self.rows * self.cols, self.rng)
+        self.heap.fill(self.entropy(0) if self.wave.size else 0)
+
+        # with backtracking, every change goes on the wave's trail and every collapse is a decision that can be undone
+        self.decisions: deque[Decision] = deque()
+        if self.backtracking is not None:
+            self.wave.trail = deque()
+        # decisions undone since the last (re)start, see BacktrackLimits.max_backtracks
+        self.attempt_backtracks: int = 0
+
+        # starting over changes every cell
+        if self.changed is not None:
+            self.changed.update(range(self.wave.size))
+
+        if self.constraints:
+            self._apply_constraints(self.constraints)
+
+    def constrain(self, constraints: Iterable[tuple[int, int]]) -> None:
+        # limit cells to the tiles in their masks before solving (e.g. to match tiles placed outside the map),
+        # raises Contradiction if the constraints can't be satisfied. constraints are kept and re-applied on restarts.
+        constraints = list(constraints)
+        self.constraints.extend(constraints)
+        self._apply_constraints(constraints)
+
+    def _apply_constraints(self, constraints: list[tuple[int, int]]) -> None:
+        changed: list[int] = []
+        for i, mask in constraints:
+            if self.wave.restrict(i, mask):
+                if self.wave.domains[i] == 0:
+                    raise Contradiction(i)
+                self.update_entropy(i)
+                changed.append(i)
+
+        self.propagate(changed)
+
+    def entropy(self, i: int) -> float:
+        # with Heuristic.COUNT the entropy is just the number of possible tiles,
+        # Heuristic.SHANNON uses the Shannon entropy of their weights, which the wave keeps up to date as tiles are removed
+        if self.heuristic is Heuristic.SHANNON:
+            return self.wave.entropy(i)
+        return self.wave.counts[i]
+
+    def update_entropy(self, i: int) -> None:
+        # called for cells whose options changed, only cells that still have a choice to make stay in the heap
+        if self.changed is not None:
+            self.changed.add(i)
+        if self.wave.counts[i] > 1:
+            self.heap.push(i, self.entropy(i))
+        else:
+            self.heap.remove(i)
+
+    def find_lowest_entropy(self) -> Optional[int]:
+        # see entropy() for the heuristics
+        # the heap keeps cells ordered by entropy so this is O(log n), returns None once every cell has been collapsed
+        return self.heap.pop()
+
+    def collapse(self, i: int) -> int:
+        # place a tile based on the weights of the remaining possible tiles
+        t = self.wave.choose(i, self.rng)
+        if self.backtracking is not None:
+            self.decide(i, t)
+        self.wave.collapse(i, t)
+        return t
+
+    def propagate(self, changed: Iterable[int]) -> list[int]:
+        # the changed cells' neighbors are checked against the rules, and every neighbor that loses an option
+        # gets its own neighbors checked too, until nothing changes anymore. returns the cells that lost options
+        shrunk = self.propagator.propagate(changed)
+        for i in shrunk:
+            self.update_entropy(i)
+        return shrunk
+
+    def collapse_next(self) -> Optional[int]:
+        # one find lowest entropy -> collapse -> propagate iteration, returns the collapsed cell or None when done
+        # without backtracking a contradiction is raised, with it the solver backtracks (or restarts) and carries on
+        i = self.find_lowest_entropy()
+        if i is None:
+            return None
+
+        self.collapse(i)
+        if self.changed is not None:
+            self.changed.add(i)
+        try:
+            self.propagate([i])
+        except Contradiction as contradiction:
+            self.stats.contradictions += 1
+            if self.backtracking is None:
+                raise
+
+            if not self.backtrack():
+                if self.stats.restarts >= self.backtracking.max_restarts:
+                    raise contradiction
+                self.stats.restarts += 1
+                self.reset()
+
+        return i
+
+    def decide(self, i: int, t: int) -> None:
+        assert self.backtracking is not None
+        self.decisions.append(Decision(i, t, self.wave.mark()))
+
+        # keep the decision stack and the trail within their limits by forgetting the oldest decisions
+        max_depth, max_trail = self.backtracking.max_depth, self.backtracking.max_trail
+        assert self.wave.trail is not None
+        while self.decisions and (len(self.decisions) > max_depth or len(self.wave.trail) > max_trail):
+            self.decisions.popleft()
+            self.stats.forgotten += 1
+            # everything before the (new) oldest decision can't be undone anymore
+            self.wave.forget(self.decisions[0].mark if self.decisions else self.wave.mark())
+
+    def backtrack(self) -> bool:
+        # undo the latest decision and rule its tile out, going further back while that still contradicts
+        # returns False once there is nothing left to go back to, or this attempt has used up its backtracks
+        assert self.backtracking is not None
+        while self.decisions:
+            if self.attempt_backtracks >= self.backtracking.max_backtracks:
+                return False
+
+            i, t, mark = self.decisions.pop()
+            self.stats.backtracks += 1
+            self.attempt_backtracks += 1
+            for restored_i in self.wave.undo(mark):
+                self.update_entropy(restored_i)
+
+            # this change belongs to the previous decision, so undoing that one brings the tile back
+            self.wave.restrict(i, ~(1 << t))
+            if self.wave.domains[i] == 0:
+                continue
+
+            self.update_entropy(i)
+            try:
+                self.propagate([i])
+            except Contradiction:
+                self.stats.contradictions += 1
+                continue
+
+            return True
+
+        return False
+
+    def run(self) -> bool:
+        # returns False if a contradiction stopped the solve, see self.contradiction
+        self.run_until(math.inf)
+        return self.contradiction is None
+
+    def run_until(self, deadline: float) -> Progress:
+        # resumable solve, collapses cells until time.perf_counter() reaches deadline or the map is done
+        # (at least one cell is collapsed per call, so a solve always moves forward)
+        if self.done:
+            return self.progress()
+
+        try:
+            while True:
+                if self.collapse_next() is None:
+                    self.done = True
+                    break
+                if time.perf_counter() >= deadline:
+                    break
+        except Contradiction as contradiction:
+            self.contradiction = contradiction.i
+            self.done = True
+
+        return self.progress()
+
+    def step(self, budget_ms: float) -> Progress:
+        # as many collapse -> propagate iterations as fit in budget_ms, meant to be called once per frame
+        return self.run_until(time.perf_counter() + budget_ms / 1000.0)
+
+    def progress(self) -> Progress:
+        remaining = len(self.heap)
+        return Progress(self.wave.size - remaining, remaining, self.done)
+
+    def track_changes(self) -> None:
+        # start collecting the cells that change, to redraw only those
+        if self.changed is None:
+            self.changed = set()
+
+    def take_changed(self) -> set[int]:
+        # cells whose options changed since the last call (track_changes() has to be called first)
+        assert self.changed is not None
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def tiles(self) -> list[int]:
+        # tile values of the solved map, UNSET for cells that never got a tile
+        return self.wave.tiles()
@@ -0,0 +1,131 @@
+from __future__ import annotations
+from typing import Any, BinaryIO, Iterable, Mapping, Optional, Sequence
+
+import sys
+import time
+
+from .wave import UNSET
+
+
+RESET: str = "\x1b[0m"
+CLEAR_SCREEN: bytes = b"\x1b[2J"
+HIDE_CURSOR: bytes = b"\x1b[?25l"
+SHOW_CURSOR: bytes = b"\x1b[?25h"
+
+# what cells without a tile are drawn as
+UNSET_CELL: str = "\x1b[37m \N{BULLET} \x1b[0m"
+
+
+def background(color: int, text: str = "   ") -> str:
+    # a cell drawn as `text` on an ANSI background color (40-47)
+    return f"\x1b[{color}m{text}{RESET}"
+
+
+def move_to(row: int, col: int) -> bytes:
+    # cursor addressing is 1-based
+    return f"\x1b[{row + 1};{col + 1}H".encode()
+
+
+# renders tilemaps as ANSI colored text, a lot faster than a print() per cell
+# every tile's escape sequence is encoded once up front, a frame is joined into one buffer and written in one go,
+# and redraw() only rewrites the cells that changed (moving the cursor to them), for live views of a solve
+class TerminalRenderer:
+    def __init__(
+            self,
+            rows: int,
+            cols: int,
+            # tile value -> cell text, keyed by ints or an IntEnum of them (the Tiles of simpler.py), Mapping is
+            # invariant in its keys so dict[Tiles, str] wouldn't pass as Mapping[int, str]
+            palette: Mapping[Any, str],
+            unset: str = UNSET_CELL,
+            cell_width: int = 3,
+            out: Optional[BinaryIO] = None
+        ) -> None:
+        self.rows = rows
+        self.cols = cols
+        # printed width of one cell, to move the cursor to a column
+        self.cell_width = cell_width
+        self.out: BinaryIO = out if out is not None else sys.stdout.buffer
+
+        # tile value -> encoded cell
+        self.cells: dict[int, bytes] = {tile: text.encode() for tile, text in palette.items()}
+        self.cells[UNSET] = unset.encode()
+        # screen row the map starts at, set by draw(..., home=True)
+        self.top: int = 0
+
+    def frame(self, tiles: Sequence[int]) -> bytes:
+        # whole map as one buffer, rows joined with newlines
+        cells = self.cells
+        cols = self.cols
+        lines = [b"".join(map(cells.__getitem__, tiles[row * cols:(row + 1) * cols])) for row in range(self.rows)]
+        return b"\n".join(lines) + b"\n"
+
+    def draw(self, tiles: Sequence[int], home: bool = False) -> None:
+        # with home=True the screen is cleared and the map drawn from the top left, so redraw() can address its cells
+        data = self.frame(tiles)
+        if home:
+            data = CLEAR_SCREEN + move_to(0, 0) + data
+            self.top = 0
+        self.out.write(data)
+        self.out.flush()
+
+    def redraw(self, changes: Iterable[tuple[int, int]]) -> None:
+        # rewrite only the changed (cell, tile) pairs of a map drawn with draw(..., home=True)
+        # runs of changed cells on the same row are written after a single cursor move
+        cells = self.cells
+        cols = self.cols
+        width = self.cell_width
+        parts: list[bytes] = []
+        previous = -2
+        for i, tile in sorted(changes):
+            if i != previous + 1 or i % cols == 0:
+                row, col = divmod(i, cols)
+                parts.append(move_to(self.top + row, col * width))
+            parts.append(cells[tile])
+            previous = i
+
+        if not parts:
+            return
+
+        # park the cursor below the map again
+        parts.append(move_to(self.top + self.rows, 0))
+        self.out.write(b"".join(parts))
+        self.out.flush()
+
+
+# main entry
+def main() -> None:
+    # live view of a solve: the map is drawn once and then only the cells that change are redrawn
+    from .simpler import CONNECTIONS, MAP_HEIGHT, MAP_WIDTH, PALETTE, WEIGHTS, compile_connections
+    from .solver import Solver
+
+    rows: int = MAP_HEIGHT
+    cols: int = MAP_WIDTH
+    frame_ms: float = 1000.0 / 30.0
+    solver = Solver(compile_connections(CONNECTIONS, WEIGHTS), rows, cols)
+    solver.track_changes()
+    renderer = TerminalRenderer(rows, cols, PALETTE)
+
+    out = renderer.out
+    out.write(HIDE_CURSOR)
+    try:
+        renderer.draw(solver.tiles(), home=True)
+        while True:
+            frame_start = time.perf_counter()
+            progress = solver.step(frame_ms / 2)
+            wave = solver.wave
+            renderer.redraw((i, wave.tile(i)) for i in solver.take_changed())
+            if progress.done:
+                break
+            time.sleep(max(0.0, frame_ms / 1000.0 - (time.perf_counter() - frame_start)))
+    finally:
+        out.write(SHOW_CURSOR)
+        out.flush()
+
+    if solver.contradiction is not None:
+        row, col = divmod(solver.contradiction, cols)
+        print(f"Contradiction at row {row}, col {col}")
+
+
+if __name__ == "__main__":
+    main()
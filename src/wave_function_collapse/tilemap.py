@@ -0,0 +1,35 @@
+from __future__ import annotations
+from typing import Iterable
+
+from .wave import UNSET
+
+
+# the tile values a tilemap should show and which cells changed since they were last drawn
+# this is the bookkeeping half of the viewer's TilemapRenderer, kept apart from raylib so it can be used
+# (and benchmarked, see benchmark.py) without a window. cells are numbered row by row.
+class DirtyTiles:
+    def __init__(self, rows: int, cols: int) -> None:
+        self.rows = rows
+        self.cols = cols
+        # tile value of each cell as it should be drawn, UNSET for empty cells
+        self.tiles: list[int] = [UNSET] * (rows * cols)
+        self.dirty: set[int] = set()
+
+    def set_tile(self, i: int, tile: int) -> None:
+        if self.tiles[i] != tile:
+            self.tiles[i] = tile
+            self.dirty.add(i)
+
+    def mark_dirty(self, cells: Iterable[int]) -> None:
+        self.dirty.update(cells)
+
+    def take_dirty(self, top: int, left: int, bottom: int, right: int) -> list[int]:
+        # dirty cells within rows top..bottom and cols left..right (inclusive), no longer dirty once returned
+        # cells outside stay dirty, so off-screen changes wait until they come into view
+        if not self.dirty:
+            return []
+
+        cols = self.cols
+        taken = [i for i in self.dirty if top <= i // cols <= bottom and left <= i % cols <= right]
+        self.dirty.difference_update(taken)
+        return taken
@@ -0,0 +1,236 @@
+from __future__ import annotations
+from array import array
+from typing import Callable, Sequence
+
+import dataclasses
+import functools
+import random
+import time
+
+
+# which cells are next to which, worked out once per grid shape instead of once per visited cell
+# every topology numbers its cells row by row (layer by layer for voxels) and lists, for every cell and direction,
+# the index of the neighbor in that direction, or NO_NEIGHBOR past an edge that doesn't wrap.
+# directions come in opposite pairs, so the opposite of direction d is always d ^ 1
+NO_NEIGHBOR = -1
+
+# square grids, the same directions as everywhere else
+UP = 0
+DOWN = 1
+LEFT = 2
+RIGHT = 3
+# voxel grids add the layers below and above (UP and DOWN stay rows within a layer)
+BELOW = 4
+ABOVE = 5
+# hex grids are "odd-r" offset grids of pointy topped hexes: odd rows sit half a cell to the right of even rows,
+# LEFT and RIGHT stay in the row and the other four directions go to the rows above and below
+UP_LEFT = 0
+DOWN_RIGHT = 1
+UP_RIGHT = 4
+DOWN_LEFT = 5
+
+
+@dataclasses.dataclass(frozen=True, slots=True, eq=False)
+class Topology:
+    # "grid", "hex" or "voxel"
+    kind: str
+    # (rows, cols), or (layers, rows, cols) for voxels
+    shape: tuple[int, ...]
+    # whether edges wrap around to the other side, for tileable maps
+    periodic: bool
+    directions: int
+    # neighbors[i * directions + d] -> cell in direction d of cell i, or NO_NEIGHBOR
+    neighbors: array[int]
+
+    @property
+    def size(self) -> int:
+        return len(self.neighbors) // self.directions
+
+    @property
+    def rows(self) -> int:
+        # rows of the flat 2D layout the cells are numbered in, voxel layers are stacked on top of each other
+        return self.size // self.shape[-1]
+
+    @property
+    def cols(self) -> int:
+        return self.shape[-1]
+
+    def opposite(self, direction: int) -> int:
+        return direction ^ 1
+
+    def neighbors_of(self, i: int) -> array[int]:
+        # the cell's neighbors by direction, NO_NEIGHBOR included. hot loops index `neighbors` directly instead
+        start = i * self.directions
+        return self.neighbors[start:start + self.directions]
+
+
+def _step(index: int, delta: int, length: int, periodic: bool) -> int:
+    # index moved by delta along an axis of the given length, or NO_NEIGHBOR when it falls off a non periodic edge
+    moved = index + delta
+    if 0 <= moved < length:
+        return moved
+    return moved % length if periodic else NO_NEIGHBOR
+
+
+@functools.lru_cache(maxsize=32)
+def grid(rows: int, cols: int, periodic: bool = False) -> Topology:
+    neighbors = array("i", [NO_NEIGHBOR]) * (rows * cols * 4)
+    for row in range(rows):
+        up = _step(row, -1, rows, periodic)
+        down = _step(row, 1, rows, periodic)
+        for col in range(cols):
+            left = _step(col, -1, cols, periodic)
+            right = _step(col, 1, cols, periodic)
+            base = (row * cols + col) * 4
+            if up != NO_NEIGHBOR:
+                neighbors[base + UP] = up * cols + col
+            if down != NO_NEIGHBOR:
+                neighbors[base + DOWN] = down * cols + col
+            if left != NO_NEIGHBOR:
+                neighbors[base + LEFT] = row * cols + left
+            if right != NO_NEIGHBOR:
+                neighbors[base + RIGHT] = row * cols + right
+
+    return Topology("grid", (rows, cols), periodic, 4, neighbors)
+
+
+@functools.lru_cache(maxsize=32)
+def hex_grid(rows: int, cols: int, periodic: bool = False) -> Topology:
+    # a periodic hex grid needs an even row count, otherwise the last and first rows would both be even (or odd)
+    # and wouldn't line up when wrapped
+    if periodic and rows % 2:
+        raise ValueError(f"a periodic hex grid needs an even number of rows, got {rows}")
+
+    neighbors = array("i", [NO_NEIGHBOR]) * (rows * cols * 6)
+    for row in range(rows):
+        # columns of the diagonal neighbors, relative to this cell's column
+        shift = row % 2
+        for col in range(cols):
+            base = (row * cols + col) * 6
+            for direction, d_row, d_col in (
+                (UP_LEFT, -1, shift - 1),
+                (DOWN_RIGHT, 1, shift),
+                (LEFT, 0, -1),
+                (RIGHT, 0, 1),
+                (UP_RIGHT, -1, shift),
+                (DOWN_LEFT, 1, shift - 1),
+            ):
+                neighbor_row = _step(row, d_row, rows, periodic)
+                neighbor_col = _step(col, d_col, cols, periodic)
+                if neighbor_row != NO_NEIGHBOR and neighbor_col != NO_NEIGHBOR:
+                    neighbors[base + direction] = neighbor_row * cols + neighbor_col
+
+    return Topology("hex", (rows, cols), periodic, 6, neighbors)
+
+
+@functools.lru_cache(maxsize=32)
+def voxel(layers: int, rows: int, cols: int, periodic: bool = False) -> Topology:
+    # periodic voxel grids wrap along all three axes
+    neighbors = array("i", [NO_NEIGHBOR]) * (layers * rows * cols * 6)
+    for layer in range(layers):
+        for row in range(rows):
+            for col in range(cols):
+                base = ((layer * rows + row) * cols + col) * 6
+                for direction, d_layer, d_row, d_col in (
+                    (UP, 0, -1, 0),
+                    (DOWN, 0, 1, 0),
+                    (LEFT, 0, 0, -1),
+                    (RIGHT, 0, 0, 1),
+                    (BELOW, -1, 0, 0),
+                    (ABOVE, 1, 0, 0),
+                ):
+                    neighbor_layer = _step(layer, d_layer, layers, periodic)
+                    neighbor_row = _step(row, d_row, rows, periodic)
+                    neighbor_col = _step(col, d_col, cols, periodic)
+                    if NO_NEIGHBOR not in (neighbor_layer, neighbor_row, neighbor_col):
+                        neighbors[base + direction] = (neighbor_layer * rows + neighbor_row) * cols + neighbor_col
+
+    return Topology("voxel", (layers, rows, cols), periodic, 6, neighbors)
+
+
+def border_constraints(
+        allowed: Sequence[Sequence[int]],
+        top: int,
+        left: int,
+        rows: int,
+        cols: int,
+        outside: Callable[[int, int], int]
+    ) -> list[tuple[int, int]]:
+    # (cell within the window, mask) limits for a rows x cols window at (top, left) of a bounded square grid,
+    # solved on its own against the tiles around it: every edge cell with a tile right outside the window is
+    # limited to the tiles allowed next to it. outside(row, col) gives the tile index at those grid coordinates,
+    # or a negative value where there is none (unset, or past the edge of the grid)
+    constraints: list[tuple[int, int]] = []
+    # (direction from the outside cell to ours, our cells, the row and column of the cell outside each of them)
+    edges = (
+        (DOWN, range(cols), lambda i: (top - 1, left + i)),
+        (UP, range((rows - 1) * cols, rows * cols), lambda i: (top + rows, left + i % cols)),
+        (RIGHT, range(0, rows * cols, cols), lambda i: (top + i // cols, left - 1)),
+        (LEFT, range(cols - 1, rows * cols, cols), lambda i: (top + i // cols, left + cols)),
+    )
+    for direction, cells, position in edges:
+        by_tile = allowed[direction]
+        for i in cells:
+            t = outside(*position(i))
+            if t >= 0:
+                constraints.append((i, by_tile[t]))
+
+    return constraints
+
+
+def violations(topology: Topology, allowed: tuple[tuple[int, ...], ...], indices: list[int]) -> int:
+    # pairs of neighboring cells whose tile indices (UNSET cells skipped) the rules don't allow next to each other
+    neighbors = topology.neighbors
+    directions = topology.directions
+    broken = 0
+    for i, t in enumerate(indices):
+        if t < 0:
+            continue
+        for direction in range(directions):
+            neighbor_i = neighbors[i * directions + direction]
+            if neighbor_i != NO_NEIGHBOR and indices[neighbor_i] >= 0 and not (allowed[direction][t] >> indices[neighbor_i]) & 1:
+                broken += 1
+
+    return broken
+
+
+# main entry
+def main() -> None:
+    from .simpler import CONNECTIONS, PALETTE, WEIGHTS, compile_connections
+    from .simpler_with_overlapping import SAMPLE_MAP, SAMPLE_MAP_COLS, SAMPLE_MAP_ROWS, SampleAnalyzer
+    from .solver import BacktrackLimits, Solver
+    from .terminal import TerminalRenderer
+
+    seed: int = 0
+
+    # a wrapping map drawn twice side by side and twice on top of each other, the seams don't show
+    rows, cols = (12, 24)
+    solver = Solver(compile_connections(CONNECTIONS, WEIGHTS), rows, cols, random.Random(seed), BacktrackLimits(), topology=grid(rows, cols, True))
+    solver.run()
+    tiles = solver.tiles()
+    doubled = [tiles[(row % rows) * cols + col % cols] for row in range(rows * 2) for col in range(cols * 2)]
+    print("Periodic map, tiled 2x2")
+    TerminalRenderer(rows * 2, cols * 2, PALETTE).draw(doubled)
+
+    # rules learned from the sample read as a hex grid and as 3 stacked copies of it, then solved on a bigger one
+    for name, sample_topology, topology in (
+        ("hex", hex_grid(SAMPLE_MAP_ROWS, SAMPLE_MAP_COLS, True), hex_grid(64, 64)),
+        ("voxel", voxel(3, SAMPLE_MAP_ROWS, SAMPLE_MAP_COLS, True), voxel(16, 32, 32)),
+    ):
+        analyzer = SampleAnalyzer()
+        analyzer.feed_cells(SAMPLE_MAP * (sample_topology.size // len(SAMPLE_MAP)), sample_topology)
+        rules = analyzer.rules(sample_topology.directions)
+
+        start = time.perf_counter()
+        solver = Solver(rules, topology.rows, topology.cols, random.Random(seed), BacktrackLimits(), topology=topology)
+        solver.run()
+        elapsed = time.perf_counter() - start
+        indices = [solver.wave.index(i) for i in range(topology.size)]
+        print(
+            f"{name} {'x'.join(map(str, topology.shape))}: {topology.size / elapsed:.0f} cells/sec, "
+            f"{violations(topology, rules.allowed, indices)} broken neighbors, contradiction {solver.contradiction}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+from __future__ import annotations
+
+import dataclasses
+import enum
+import math
+import random
+
+import pyray
+
+from .propagator import Contradiction
+from .regenerate import rect_cells, regenerate
+from .ruleset import TileTable, builtin_rules, builtin_ruleset
+from .solver import BacktrackLimits, Solver
+from .tilemap import DirtyTiles
+
+
+UNSET = -1
+
+
+class Tileset(enum.IntEnum):
+    TILE_WATER = 42 # done
+    TILE_GRASS_SHORE_TL = 37
+    TILE_GRASS_SHORE_T = 38
+    TILE_GRASS_SHORE_TR = 39
+    TILE_GRASS_SHORE_L = 49
+    TILE_GRASS = 50 # done
+    TILE_GRASS_SHORE_R = 51
+    TILE_GRASS_SHORE_BL = 61
+    TILE_GRASS_SHORE_B = 62
+    TILE_GRASS_SHORE_BR = 63
+
+
+Tile = Tileset
+
+
+def draw_tile(
+        tileset_texture: pyray.Texture,
+        tileset_cols: int,
+        tile_i: int,
+        tile_w: int,
+        tile_h: int,
+        dest_x: float,
+        dest_y: float,
+        scale: float = 1.0
+    ) -> None:
+    x = (tile_i % tileset_cols) * tile_w
+    y = math.floor(tile_i / tileset_cols) * tile_h
+    source = (x, y, tile_w, tile_h)
+    dest = (dest_x, dest_y, tile_w * scale, tile_h * scale)
+    origin = (0, 0)
+    rotation = 0
+    tint = pyray.WHITE
+    pyray.draw_texture_pro(tileset_texture, source, dest, origin, rotation, tint)
+
+
+def draw_tileset(tileset_texture: pyray.Texture, tile_size: tuple[int, int], dest_x: int, dest_y: int):
+    space_between: int = 10
+    for i, tile_i in enumerate(Tileset):
+        x = dest_x + (i * (tile_size[0] + space_between))
+        draw_tile(tileset_texture, 12, tile_i, *tile_size, x, dest_y)
+
+
+def draw_tilemap(tilemap: list[int | WFCTile], tilemap_cols: int, tileset_texture: pyray.Texture, tileset_cols: int, tile_size: tuple[int, int]) -> None:
+    for i, tile in enumerate(tilemap):
+        if tile == UNSET:
+            continue
+        
+        if isinstance(tile, WFCTile):
+            actual_tile = tile.tile
+        else:
+            actual_tile = tile
+
+        x = (i % tilemap_cols) * tile_size[0]
+        y = math.floor(i / tilemap_cols) * tile_size[1]
+        draw_tile(tileset_texture, tileset_cols, actual_tile, *tile_size, x, y)
+
+
+# the tilemap drawn into a render texture, which is blitted with a single draw call per frame
+# cells are only redrawn into the texture after they're marked dirty (see set_tile() and mark_dirty()),
+# and only once they're in view, so off-screen changes wait until the camera gets there (see tilemap.py).
+# the texture is cols * tile_w by rows * tile_h pixels, so it has to fit in the GPU's max texture size
+class TilemapRenderer(DirtyTiles):
+    def __init__(
+            self,
+            rows: int,
+            cols: int,
+            tileset_texture: pyray.Texture,
+            tileset_cols: int,
+            tile_size: tuple[int, int]
+        ) -> None:
+        super().__init__(rows, cols)
+        self.tileset_texture = tileset_texture
+        self.tileset_cols = tileset_cols
+        self.tile_size = tile_size
+        self.target = pyray.load_render_texture(cols * tile_size[0], rows * tile_size[1])
+
+        pyray.begin_texture_mode(self.target)
+        pyray.clear_background(pyray.BLACK)
+        pyray.end_texture_mode()
+
+    def unload(self) -> None:
+        pyray.unload_render_texture(self.target)
+
+    def visible(self, camera: pyray.Camera2D) -> tuple[int, int, int, int]:
+        # (first row, first col, last row, last col) of the cells in the camera's view, clamped to the tilemap
+        tile_w, tile_h = self.tile_size
+        top_left = pyray.get_screen_to_world_2d(pyray.Vector2(0, 0), camera)
+        bottom_right = pyray.get_screen_to_world_2d(pyray.Vector2(pyray.get_screen_width(), pyray.get_screen_height()), camera)
+        return (
+            max(0, int(top_left.y // tile_h)),
+            max(0, int(top_left.x // tile_w)),
+            min(self.rows - 1, int(bottom_right.y // tile_h)),
+            min(self.cols - 1, int(bottom_right.x // tile_w)),
+        )
+
+    def update(self, camera: pyray.Camera2D) -> None:
+        # redraw the dirty cells that are in view into the texture
+        if not self.dirty:
+            return
+
+        redraw = self.take_dirty(*self.visible(camera))
+        if not redraw:
+            return
+
+        cols = self.cols
+        tile_w, tile_h = self.tile_size
+        pyray.begin_texture_mode(self.target)
+        for i in redraw:
+            row, col = divmod(i, cols)
+            x, y = col * tile_w, row * tile_h
+            tile = self.tiles[i]
+            if tile == UNSET:
+                pyray.draw_rectangle(x, y, tile_w, tile_h, pyray.BLACK)
+            else:
+                draw_tile(self.tileset_texture, self.tileset_cols, tile, tile_w, tile_h, x, y)
+        pyray.end_texture_mode()
+
+    def draw(self, camera: pyray.Camera2D) -> None:
+        # blit the part of the texture that's in view, call between begin_mode_2d(camera) and end_mode_2d()
+        top, left, bottom, right = self.visible(camera)
+        if top > bottom or left > right:
+            return
+
+        tile_w, tile_h = self.tile_size
+        x, y = left * tile_w, top * tile_h
+        w, h = (right - left + 1) * tile_w, (bottom - top + 1) * tile_h
+        # render textures are stored upside down, so the source rect is flipped (negative height) and measured from the bottom
+        source = (x, self.target.texture.height - y - h, w, -h)
+        pyray.draw_texture_rec(self.target.texture, source, pyray.Vector2(x, y), pyray.WHITE)
+
+
+@dataclasses.dataclass(slots=True)
+class WFCTile:
+    tile: Tile | int = UNSET
+    up: list[Tile] = dataclasses.field(default_factory=list[Tile])
+    down: list[Tile] = dataclasses.field(default_factory=list[Tile])
+    left: list[Tile] = dataclasses.field(default_factory=list[Tile])
+    right: list[Tile] =dataclasses.field(default_factory=list[Tile])
+
+
+def wfc_tiles(table: TileTable) -> dict[Tile, WFCTile]:
+    # the connection rules of a ruleset as WFCTiles, for draw_wfc_tiles()
+    return {
+        Tile(tile.value): WFCTile(
+            Tile(tile.value),
+            *([Tile(neighbor.value) for neighbor in table.neighbors(tile.index, direction)] for direction in range(4)),
+        )
+        for tile in table
+    }
+
+
+# connection rules of the tileset, loaded from data/coast.json
+WFC_TILES: dict[Tile, WFCTile] = wfc_tiles(builtin_ruleset("coast"))
+
+
+def wfc_collapse(options: list[Tile]) -> Tile:
+    return options[random.randrange(0, len(options))]
+
+
+def draw_wfc_tile(wfc_tile: WFCTile, tileset_texture: pyray.Texture, tileset_cols: int, tile_size: tuple[int, int], dest_x: int = 0, dest_y: int = 0) -> None:
+    font_size: int = 12
+    font_color = pyray.WHITE
+    space_between_sections: int = 10
+    tile_start_x: int = dest_x + 32
+
+    cur_x: int = dest_x
+    cur_y: int = dest_y
+    pyray.draw_text("Tile", cur_x, cur_y, font_size, font_color)
+    cur_x = tile_start_x
+    draw_tile(tileset_texture, tileset_cols, wfc_tile.tile, *tile_size, cur_x, cur_y)
+    cur_y += tile_size[1]
+    cur_y += space_between_sections
+
+    cur_x = dest_x
+    pyray.draw_text("Up", cur_x, cur_y, font_size, font_color)
+    cur_x = tile_start_x
+    for _, tile_i in enumerate(wfc_tile.up):
+        y = cur_y
+        draw_tile(tileset_texture, tileset_cols, tile_i, *tile_size, cur_x, y)
+        y += tile_size[1]
+        draw_tile(tileset_texture, tileset_cols, wfc_tile.tile, *tile_size, cur_x, y)
+        cur_x += tile_size[0]
+        cur_x += space_between_sections
+
+    cur_y += tile_size[1] * 2
+    cur_y += space_between_sections
+    
+    cur_x = dest_x
+    pyray.draw_text("Down", cur_x, cur_y, font_size, font_color)
+    cur_x = tile_start_x
+    for _, tile_i in enumerate(wfc_tile.down):
+        y = cur_y
+        draw_tile(tileset_texture, tileset_cols, wfc_tile.tile, *tile_size, cur_x, y)
+        y += tile_size[1]
+        draw_tile(tileset_texture, tileset_cols, tile_i, *tile_size, cur_x, y)
+        cur_x += tile_size[0]
+        cur_x += space_between_sections
+
+    cur_y += tile_size[1] * 2
+    cur_y += space_between_sections
+    
+    cur_x = dest_x
+    pyray.draw_text("Left", cur_x, cur_y, font_size, font_color)
+    cur_x = tile_start_x
+    for _, tile_i in enumerate(wfc_tile.left):
+        x = cur_x
+        draw_tile(tileset_texture, tileset_cols, tile_i, *tile_size, x, cur_y)
+        x += tile_size[0]
+        draw_tile(tileset_texture, tileset_cols, wfc_tile.tile, *tile_size, x, cur_y)
+        cur_y += tile_size[1]
+        cur_y += space_between_sections
+
+    cur_x = dest_x
+    pyray.draw_text("Right", cur_x, cur_y, font_size, font_color)
+    cur_x = tile_start_x
+    for _, tile_i in enumerate(wfc_tile.right):
+        x = cur_x
+        draw_tile(tileset_texture, tileset_cols, wfc_tile.tile, *tile_size, x, cur_y)
+        x += tile_size[0]
+        draw_tile(tileset_texture, tileset_cols, tile_i, *tile_size, x, cur_y)
+        cur_y += tile_size[1]
+        cur_y += space_between_sections
+
+
+def draw_wfc_tiles(wfc_tiles: dict[Tile, WFCTile], tileset_texture: pyray.Texture, tileset_cols: int, tile_size: tuple[int, int], x: int = 0, y: int = 0) -> None:
+    pyray.draw_text("Tileset", x, y, 12, pyray.WHITE)
+    draw_tileset(tileset_texture, tile_size, x + 50, y)
+    y += 32
+    for _, tile in wfc_tiles.items():
+        draw_wfc_tile(tile, tileset_texture, tileset_cols, tile_size, x, y)
+        x += 155
+
+
+def main() -> None:
+    pyray.init_window(1700, 400, "Wave Function Collapse")
+
+    tileset_texture = pyray.load_texture("assets/tiles_packed.png")
+    _tileset_rows, tileset_cols = (10, 12)
+    tile_size = _tile_w, _tile_h = (16, 16)
+
+    # compiled from data/coast.json once, then loaded from the cache
+    rules = builtin_rules("coast")
+
+    # the solver runs inside the frame loop, a few milliseconds per frame, so the window stays responsive
+    # while the map fills in. SPACE starts (or pauses) solving, R starts over with a new map,
+    # and once the map is done a left click wipes the cells around the cursor and solves just those again
+    _tilemap_size = tilemap_rows, tilemap_cols = (128, 128)
+    solve_budget_ms: float = 8.0
+    solver = Solver(rules, tilemap_rows, tilemap_cols, backtracking=BacktrackLimits())
+    solver.track_changes()
+    solving: bool = False
+    brush_size: int = 8
+
+    renderer = TilemapRenderer(tilemap_rows, tilemap_cols, tileset_texture, tileset_cols, tile_size)
+
+    # arrow keys pan, the mouse wheel zooms
+    camera = pyray.Camera2D(pyray.Vector2(0, 0), pyray.Vector2(0, 0), 0.0, 1.0)
+    pan_speed: float = 400.0
+
+    pyray.set_target_fps(60)
+
+    # main loop
+    while not pyray.window_should_close():
+        frame_time = pyray.get_frame_time()
+        if pyray.is_key_down(pyray.KeyboardKey.KEY_RIGHT):
+            camera.target.x += pan_speed * frame_time / camera.zoom
+        if pyray.is_key_down(pyray.KeyboardKey.KEY_LEFT):
+            camera.target.x -= pan_speed * frame_time / camera.zoom
+        if pyray.is_key_down(pyray.KeyboardKey.KEY_DOWN):
+            camera.target.y += pan_speed * frame_time / camera.zoom
+        if pyray.is_key_down(pyray.KeyboardKey.KEY_UP):
+            camera.target.y -= pan_speed * frame_time / camera.zoom
+        camera.zoom = min(8.0, max(0.125, camera.zoom * (1.0 + pyray.get_mouse_wheel_move() * 0.1)))
+
+        if pyray.is_key_released(pyray.KeyboardKey.KEY_SPACE):
+            solving = not solving
+        if pyray.is_key_released(pyray.KeyboardKey.KEY_R):
+            solver = Solver(rules, tilemap_rows, tilemap_cols, backtracking=BacktrackLimits())
+            solver.track_changes()
+            for i in range(tilemap_rows * tilemap_cols):
+                renderer.set_tile(i, UNSET)
+
+        if solver.done and solver.contradiction is None and pyray.is_mouse_button_released(pyray.MouseButton.MOUSE_BUTTON_LEFT):
+            mouse = pyray.get_screen_to_world_2d(pyray.get_mouse_position(), camera)
+            row, col = int(mouse.y // tile_size[1]) - brush_size // 2, int(mouse.x // tile_size[0]) - brush_size // 2
+            cells = rect_cells(row, col, brush_size, brush_size, tilemap_rows, tilemap_cols)
+            try:
+                # the renderer's tiles are the map, they're regenerated in place and the cells redrawn
+                renderer.mark_dirty(regenerate(rules, renderer.tiles, tilemap_rows, tilemap_cols, cells, solver.rng))
+            except Contradiction:
+                pass
+
+        if solving:
+            progress = solver.step(solve_budget_ms)
+            solving = not progress.done
+        else:
+            progress = solver.progress()
+
+        # only cells the solver touched are redrawn, cells that aren't collapsed yet are drawn empty
+        for i in solver.take_changed():
+            renderer.set_tile(i, solver.wave.tile(i))
+        renderer.update(camera)
+
+        pyray.begin_drawing()
+        pyray.clear_background(pyray.BLACK)
+
+        #draw_wfc_tiles(WFC_TILES, tileset_texture, tileset_cols, tile_size, 10, 10)
+
+        pyray.begin_mode_2d(camera)
+        renderer.draw(camera)
+        pyray.end_mode_2d()
+
+        status = f"{progress.collapsed}/{progress.collapsed + progress.remaining} cells, {progress.remaining} queued"
+        if solver.contradiction is not None:
+            status += f", contradiction at cell {solver.contradiction}"
+        pyray.draw_text(status, 10, 10, 12, pyray.WHITE)
+        pyray.draw_fps(10, 26)
+
+        pyray.end_drawing()
+
+    renderer.unload()
+    pyray.unload_texture(tileset_texture)
+    pyray.close_window()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+from __future__ import annotations
+from array import array
+from collections import deque
+from typing import Optional
+
+import math
+import random
+
+from .rules import CompiledRules, iter_bits
+from .sampling import WALK_TILES, WeightedSampler
+
+
+UNSET = -1
+
+
+# the "super-positioned" map, one bitmask of possible tile indices per cell
+# instead of a list of Tiles per cell, so a cell costs a pointer to a (usually cached small) int.
+# tile counts, weight sums and sums of w * log(w) are cached per cell in flat arrays and kept up to date as tiles
+# are removed, which is all the Shannon entropy of a cell needs (see entropy()).
+class Wave:
+    def __init__(self, size: int, rules: CompiledRules) -> None:
+        self.rules = rules
+        self.size = size
+        self.domains: list[int] = [rules.full] * size
+        self.counts: array[int] = array("I", [len(rules.tiles)]) * size
+        self.weight_sums: array[float] = array("d", [sum(rules.weights)]) * size
+        # tile index -> w * log(w)
+        self.weight_logs: tuple[float, ...] = tuple(w * math.log(w) if w > 0 else 0.0 for w in rules.weights)
+        self.weight_log_sums: array[float] = array("d", [sum(self.weight_logs)]) * size
+        # weighted picks for collapse, with the cumulative weights of recurring domains cached (see sampling.py)
+        self.sampler: WeightedSampler = WeightedSampler(rules.weights)
+
+        # undo log for backtracking, (cell, old domain, old weight sum, old w * log(w) sum) per change, None when not backtracking
+        # positions into the trail are absolute, `trail_base` counts the entries already forgotten from the front
+        self.trail: Optional[deque[tuple[int, int, float, float]]] = None
+        self.trail_base: int = 0
+
+    def restrict(self, i: int, mask: int) -> bool:
+        # keep only the tiles of cell i that are also in mask, returns True if the cell lost any tiles
+        old = self.domains[i]
+        new = old & mask
+        if new == old:
+            return False
+
+        if self.trail is not None:
+            self.trail.append((i, old, self.weight_sums[i], self.weight_log_sums[i]))
+
+        self.domains[i] = new
+        count = new.bit_count()
+        self.counts[i] = count
+        if count <= 1:
+            # set exactly instead of subtracting, so float error doesn't pile up on collapsed cells
+            t = new.bit_length() - 1
+            self.weight_sums[i] = self.rules.weights[t] if count else 0.0
+            self.weight_log_sums[i] = self.weight_logs[t] if count else 0.0
+        else:
+            weights = self.rules.weights
+            weight_logs = self.weight_logs
+            weight_sum = self.weight_sums[i]
+            weight_log_sum = self.weight_log_sums[i]
+            for t in iter_bits(old ^ new):
+                weight_sum -= weights[t]
+                weight_log_sum -= weight_logs[t]
+            self.weight_sums[i] = weight_sum
+            self.weight_log_sums[i] = weight_log_sum
+
+        return True
+
+    def mark(self) -> int:
+        # current position in the trail, to undo back to later
+        assert self.trail is not None
+        return self.trail_base + len(self.trail)
+
+    def undo(self, mark: int) -> list[int]:
+        # roll every change made since mark back, returns the cells that were restored
+        assert self.trail is not None
+        trail = self.trail
+        restored: list[int] = []
+        while self.trail_base + len(trail) > mark:
+            i, domain, weight_sum, weight_log_sum = trail.pop()
+            self.domains[i] = domain
+            self.counts[i] = domain.bit_count()
+            self.weight_sums[i] = weight_sum
+            self.weight_log_sums[i] = weight_log_sum
+            restored.append(i)
+
+        return restored
+
+    def forget(self, mark: int) -> None:
+        # drop trail entries before mark, they can't be undone anymore
+        assert self.trail is not None
+        trail = self.trail
+        while self.trail_base < mark and trail:
+            trail.popleft()
+            self.trail_base += 1
+
+    def entropy(self, i: int) -> float:
+        # Shannon entropy of cell i's weighted options, -sum(p * log(p)) with p = w / sum(w),
+        # which works out to log(sum(w)) - sum(w * log(w)) / sum(w) so it's O(1) from the cached sums
+        weight_sum = self.weight_sums[i]
+        if weight_sum <= 0.0:
+            return 0.0
+
+        return math.log(weight_sum) - self.weight_log_sums[i] / weight_sum
+
+    def collapse(self, i: int, t: int) -> None:
+        self.restrict(i, 1 << t)
+
+    def choose(self, i: int, rng: random.Random) -> int:
+        # weighted pick of one of cell i's tile indices, or UNSET if it has none left
+        # cells with a handful of tiles left walk the set bits against the cached weight sum, bigger domains
+        # binary search the sampler's cached cumulative weights (see sampling.py)
+        if self.counts[i] > WALK_TILES:
+            return self.sampler.choose(self.domains[i], rng)
+
+        weights = self.rules.weights
+        r = rng.random() * self.weight_sums[i]
+        t = UNSET
+        for t in iter_bits(self.domains[i]):
+            r -= weights[t]
+            if r < 0:
+                break
+
+        return t
+
+    def index(self, i: int) -> int:
+        # tile index of cell i, or UNSET if it isn't collapsed (or has no tiles left)
+        if self.counts[i] != 1:
+            return UNSET
+
+        return self.domains[i].bit_length() - 1
+
+    def tile(self, i: int) -> int:
+        # tile value of cell i, or UNSET
+        t = self.index(i)
+        return self.rules.tiles[t] if t != UNSET else UNSET
+
+    def tiles(self) -> list[int]:
+        return [self.tile(i) for i in range(self.size)]
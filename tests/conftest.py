@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+
+# compiled rulesets are cached on disk (see cache.py), the tests keep theirs in a temporary directory instead of
+# the user's cache. it's set when pytest starts rather than in a fixture, since test modules load their rules on import
+_cache_dir: str = ""
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    global _cache_dir
+    _cache_dir = tempfile.mkdtemp(prefix="wfc-test-cache-")
+    os.environ["WFC_CACHE_DIR"] = _cache_dir
+
+
+def pytest_unconfigure(config: pytest.Config) -> None:
+    if _cache_dir:
+        shutil.rmtree(_cache_dir, ignore_errors=True)
+        if os.environ.get("WFC_CACHE_DIR") == _cache_dir:
+            del os.environ["WFC_CACHE_DIR"]
+
+
+@pytest.fixture
+def cache_dir() -> str:
+    # the temporary rules cache, for tests that look at what was written to it
+    return _cache_dir
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import os
+
+import pytest
+
+from wave_function_collapse.__main__ import parse_args
+from wave_function_collapse.generate import build_parser, run
+from wave_function_collapse.mapfile import MapFile
+
+
+def test_both_entry_points_parse_the_same_flags() -> None:
+    argv = ["--ruleset", "coast", "--count", "3", "--wrap", "--backtrack", "--max-backtracks", "10", "--format", "json"]
+    args = vars(parse_args(["generate", *argv]))
+    assert args.pop("command") == "generate"
+    assert args == vars(build_parser().parse_args(argv))
+
+
+def test_text_output_has_one_line_per_row(capsys: pytest.CaptureFixture[str]) -> None:
+    assert run(build_parser().parse_args(["--rows", "5", "--cols", "7", "--count", "2", "--workers", "1"])) == 0
+    maps = capsys.readouterr().out.split("\n\n")
+    assert len(maps) == 2
+    assert all(len(row.split()) == 7 for tiles in maps for row in tiles.splitlines())
+
+
+def test_map_files_are_named_after_ruleset_and_seed(tmp_path) -> None:
+    argv = ["--ruleset", "coast", "--rows", "8", "--cols", "8", "--seed", "4", "--count", "2", "--backtrack"]
+    assert run(build_parser().parse_args([*argv, "--format", "wfcmap", "--output", str(tmp_path)])) == 0
+    assert sorted(os.listdir(tmp_path)) == ["coast_4.wfcmap", "coast_5.wfcmap"]
+    with MapFile(os.path.join(tmp_path, "coast_5.wfcmap")) as map_file:
+        assert map_file.header.seed == 5
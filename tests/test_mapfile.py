@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from wave_function_collapse.mapfile import MapFile, ruleset_hash, save_map
+from wave_function_collapse.rules import CompiledRules
+from wave_function_collapse.ruleset import builtin_rules
+from wave_function_collapse.solver import BacktrackLimits, Solver
+from wave_function_collapse.wave import UNSET
+
+
+def wide_rules(tile_count: int) -> CompiledRules:
+    # every tile allowed next to every other, enough tiles to need 16-bit indices
+    full = (1 << tile_count) - 1
+    return CompiledRules(tuple(range(100, 100 + tile_count)), (1.0,) * tile_count, ((full,) * tile_count,) * 4)
+
+
+@pytest.mark.parametrize("rules", [builtin_rules("coast"), wide_rules(300)], ids=["8-bit", "16-bit"])
+def test_map_file_round_trip(tmp_path, rules: CompiledRules) -> None:
+    rows, cols = (20, 30)
+    solver = Solver(rules, rows, cols, random.Random(4), BacktrackLimits())
+    assert solver.run()
+    tiles = solver.tiles()
+    # cells without a tile survive the trip too
+    tiles[7] = UNSET
+
+    path = str(tmp_path / "map.wfcmap")
+    save_map(path, rules, rows, cols, tiles, seed=4)
+    with MapFile(path) as map_file:
+        assert map_file.header.rows == rows and map_file.header.cols == cols
+        assert map_file.header.tiles == rules.tiles
+        assert map_file.header.seed == 4
+        assert map_file.header.ruleset_hash == ruleset_hash(rules)
+        assert map_file.tile_values() == tiles
+        assert map_file.tile(0, 7) == UNSET
+        assert map_file.tile(3, 4) == tiles[3 * cols + 4]
+
+        row = map_file.row(5)
+        region = list(map_file.region(2, 25, 4, 10))
+
+    # rows and regions are copies, they outlive the file
+    values = rules.tiles
+    assert [values[t] for t in row] == tiles[5 * cols:6 * cols]
+    assert len(region) == 4
+    for n, indices in enumerate(region):
+        start = (2 + n) * cols
+        assert [values[t] for t in indices] == tiles[start + 25:start + cols]
+
+
+@pytest.mark.parametrize("contents", [b"", b"WFCM", b"not a map file at all" * 10], ids=["empty", "short", "garbage"])
+def test_map_file_rejects_bad_files(tmp_path, contents: bytes) -> None:
+    path = tmp_path / "bad.wfcmap"
+    path.write_bytes(contents)
+    with pytest.raises(ValueError):
+        MapFile(str(path))
+
+
+def test_map_file_rejects_truncated_files(tmp_path) -> None:
+    rules = builtin_rules("coast")
+    path = tmp_path / "map.wfcmap"
+    save_map(str(path), rules, 4, 4, [rules.tiles[0]] * 16)
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError, match="truncated"):
+        MapFile(str(path))
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from wave_function_collapse.overlapping import build_model, extract_patterns, output_size, solve
+from wave_function_collapse.simpler_with_overlapping import SAMPLE_MAP, SAMPLE_MAP_COLS, SAMPLE_MAP_ROWS
+from wave_function_collapse.solver import BacktrackLimits
+from wave_function_collapse.wave import UNSET
+
+
+def agree(a: tuple[int, ...], b: tuple[int, ...], n: int, d_row: int, d_col: int) -> bool:
+    # whether pattern b, placed (d_row, d_col) away from pattern a, matches a wherever they overlap
+    for row in range(n):
+        for col in range(n):
+            other_row, other_col = row - d_row, col - d_col
+            if 0 <= other_row < n and 0 <= other_col < n and a[row * n + col] != b[other_row * n + other_col]:
+                return False
+    return True
+
+
+def test_overlap_rules_match_brute_force() -> None:
+    model = build_model(SAMPLE_MAP, SAMPLE_MAP_ROWS, SAMPLE_MAP_COLS, n=3)
+    n = model.n
+    # UP, DOWN, LEFT, RIGHT
+    offsets = ((-1, 0), (1, 0), (0, -1), (0, 1))
+    for direction, (d_row, d_col) in enumerate(offsets):
+        for a, pattern in enumerate(model.patterns):
+            expected = 0
+            for b, other in enumerate(model.patterns):
+                if agree(pattern, other, n, d_row, d_col):
+                    expected |= 1 << b
+            assert model.rules.allowed[direction][a] == expected, (direction, a)
+
+
+def test_symmetry_counts() -> None:
+    plain = extract_patterns(SAMPLE_MAP, SAMPLE_MAP_ROWS, SAMPLE_MAP_COLS, n=2, symmetry=1)
+    every = extract_patterns(SAMPLE_MAP, SAMPLE_MAP_ROWS, SAMPLE_MAP_COLS, n=2, symmetry=8)
+    # a periodic sample has one window per cell, each counted once per symmetry
+    assert sum(plain.values()) == SAMPLE_MAP_ROWS * SAMPLE_MAP_COLS
+    assert sum(every.values()) == SAMPLE_MAP_ROWS * SAMPLE_MAP_COLS * 8
+    assert set(plain) <= set(every)
+
+
+def test_solved_output_is_made_of_sample_patterns() -> None:
+    model = build_model(SAMPLE_MAP, SAMPLE_MAP_ROWS, SAMPLE_MAP_COLS, n=3)
+    rows, cols = (20, 30)
+    solver, tiles = solve(model, rows, cols, random.Random(0), BacktrackLimits())
+    assert solver.contradiction is None
+    assert (solver.rows, solver.cols) == output_size(model, rows, cols)
+    assert UNSET not in tiles
+
+    # every n x n window of the output is one of the model's patterns
+    n = model.n
+    patterns = set(model.patterns)
+    for row in range(rows - n + 1):
+        for col in range(cols - n + 1):
+            window = tuple(tiles[(row + dy) * cols + col + dx] for dy in range(n) for dx in range(n))
+            assert window in patterns, (row, col)
+
+
+@pytest.mark.parametrize("size", [(2, 10), (10, 2)], ids=["rows", "cols"])
+def test_maps_smaller_than_a_pattern_are_refused(size: tuple[int, int]) -> None:
+    model = build_model(SAMPLE_MAP, SAMPLE_MAP_ROWS, SAMPLE_MAP_COLS, n=3)
+    with pytest.raises(ValueError):
+        solve(model, *size, random.Random(0))
+    # exactly one pattern is fine
+    solver, tiles = solve(model, 3, 3, random.Random(0))
+    assert (solver.rows, solver.cols) == (1, 1)
+    assert len(tiles) == 9
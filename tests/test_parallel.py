@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import pytest
+
+from wave_function_collapse.parallel import partition, solve_parallel, find_violation
+from wave_function_collapse.simpler import CONNECTIONS, WEIGHTS, compile_connections
+
+
+RULES = compile_connections(CONNECTIONS, WEIGHTS)
+
+
+def indices(tiles: list[int]) -> list[int]:
+    index = {tile: t for t, tile in enumerate(RULES.tiles)}
+    return [index.get(tile, -1) for tile in tiles]
+
+
+@pytest.mark.parametrize(
+    ("rows", "cols", "region_size", "margin"),
+    [(128, 128, 32, 2), (129, 129, 128, 2), (129, 130, 32, 2), (66, 65, 32, 2), (100, 37, 16, 3), (5, 5, 4, 1), (3, 200, 64, 2)],
+)
+def test_partition_covers_every_cell_once(rows: int, cols: int, region_size: int, margin: int) -> None:
+    interiors, vertical, horizontal = partition(rows, cols, region_size, margin)
+    covered = [0] * (rows * cols)
+    for rect in interiors + vertical + horizontal:
+        assert rect.rows > 0 and rect.cols > 0
+        assert rect.top >= 0 and rect.left >= 0
+        assert rect.top + rect.rows <= rows and rect.left + rect.cols <= cols
+        for row in range(rect.top, rect.top + rect.rows):
+            for col in range(rect.left, rect.left + rect.cols):
+                covered[row * cols + col] += 1
+
+    assert covered == [1] * (rows * cols)
+
+
+@pytest.mark.parametrize(("size", "region_size"), [(129, 128), (129, 32), (66, 32)])
+def test_solve_parallel_sizes_not_multiple_of_region(size: int, region_size: int) -> None:
+    result = solve_parallel(RULES, size, size, seed=1, workers=2, region_size=region_size, mode="threads")
+    assert len(result.tiles) == size * size
+    assert find_violation(RULES, size, size, indices(result.tiles)) is None
+
+
+def test_concurrent_thread_solves_keep_their_own_rules() -> None:
+    from concurrent.futures import ThreadPoolExecutor
+
+    from wave_function_collapse.ruleset import builtin_rules
+
+    coast = builtin_rules("coast")
+    with ThreadPoolExecutor(2) as pool:
+        simpler = pool.submit(solve_parallel, RULES, 64, 64, 0, 2, 32, mode="threads")
+        other = pool.submit(solve_parallel, coast, 64, 64, 0, 2, 32, mode="threads")
+        simpler_result, coast_result = simpler.result(), other.result()
+
+    assert set(simpler_result.tiles) <= set(RULES.tiles)
+    assert set(coast_result.tiles) <= set(coast.tiles)
+
+
+def test_rects_that_take_too_long_are_repaired() -> None:
+    # neighbors must differ: seams squeezed between solved regions often can't be solved and search for long,
+    # rect_seconds gives up on them so they're repaired (or the map solved sequentially) instead
+    from wave_function_collapse.rules import compile_rules
+
+    rules = compile_rules(range(3), [1.0] * 3, [(a, b, d) for a in range(3) for b in range(3) for d in range(4) if a != b])
+    result = solve_parallel(rules, 64, 64, seed=0, workers=1, region_size=16, mode="threads", rect_seconds=0.05, repair_seconds=0.1)
+    assert result.repairs > 0
+    assert result.contradiction is None
+    index = {tile: t for t, tile in enumerate(rules.tiles)}
+    assert find_violation(rules, 64, 64, [index.get(tile, -1) for tile in result.tiles]) is None
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from wave_function_collapse.propagator import Contradiction, Propagator
+from wave_function_collapse.rules import CompiledRules, supported_mask
+from wave_function_collapse.ruleset import builtin_rules
+from wave_function_collapse.simpler_with_overlapping import SAMPLE_MAP, SAMPLE_MAP_COLS, SAMPLE_MAP_ROWS, SampleAnalyzer
+from wave_function_collapse.topology import NO_NEIGHBOR, Topology, grid, hex_grid
+from wave_function_collapse.wave import Wave
+
+
+COAST = builtin_rules("coast")
+
+
+def hex_rules() -> CompiledRules:
+    analyzer = SampleAnalyzer()
+    analyzer.feed_cells(SAMPLE_MAP, hex_grid(SAMPLE_MAP_ROWS, SAMPLE_MAP_COLS, True))
+    return analyzer.rules(6)
+
+
+def assert_arc_consistent(wave: Wave, topology: Topology) -> None:
+    # every option left in a cell is allowed next to at least one option of each of its neighbors
+    for i, mask in enumerate(wave.domains):
+        for direction in range(topology.directions):
+            neighbor = topology.neighbors[i * topology.directions + direction]
+            if neighbor != NO_NEIGHBOR:
+                supported = supported_mask(wave.rules, direction, mask)
+                assert wave.domains[neighbor] & ~supported == 0, (i, direction)
+
+
+@pytest.mark.parametrize("topology", [grid(12, 16), grid(12, 16, True), hex_grid(12, 16)], ids=["grid", "periodic", "hex"])
+def test_propagation_leaves_every_cell_supported(topology: Topology) -> None:
+    rules = COAST if topology.directions == 4 else hex_rules()
+    rng = random.Random(0)
+    wave = Wave(topology.size, rules)
+    propagator = Propagator(wave, topology)
+    for _ in range(20):
+        i = rng.randrange(topology.size)
+        if wave.counts[i] <= 1:
+            continue
+        wave.collapse(i, wave.choose(i, rng))
+        try:
+            propagator.propagate([i])
+        except Contradiction:
+            return
+        assert_arc_consistent(wave, topology)
+
+
+def test_propagation_reports_an_emptied_cell() -> None:
+    # two tiles that can't sit next to each other in any direction, so a cell between them runs out of options
+    rules = CompiledRules((0, 1), (1.0, 1.0), ((0b01, 0b10),) * 4)
+    wave = Wave(3, rules)
+    propagator = Propagator(wave, grid(1, 3))
+    wave.collapse(0, 0)
+    wave.collapse(2, 1)
+    with pytest.raises(Contradiction):
+        propagator.propagate([0, 2])
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from wave_function_collapse.regenerate import components, rect_cells, regenerate
+from wave_function_collapse.ruleset import builtin_rules
+from wave_function_collapse.solver import BacktrackLimits, Solver
+from wave_function_collapse.topology import grid, violations
+
+
+RULES = builtin_rules("coast")
+ROWS, COLS = (48, 64)
+
+
+@pytest.fixture
+def solved() -> list[int]:
+    solver = Solver(RULES, ROWS, COLS, random.Random(0), BacktrackLimits())
+    assert solver.run()
+    return solver.tiles()
+
+
+def broken(tiles: list[int]) -> int:
+    index = {tile: t for t, tile in enumerate(RULES.tiles)}
+    return violations(grid(ROWS, COLS), RULES.allowed, [index[tile] for tile in tiles])
+
+
+@pytest.mark.parametrize(
+    "cells",
+    [
+        rect_cells(10, 12, 8, 8, ROWS, COLS),
+        # clipped at the corner of the map
+        rect_cells(-3, 58, 10, 10, ROWS, COLS),
+        # scattered cells, solved as separate groups
+        [0, 5 * COLS + 40, 30 * COLS + 3, 47 * COLS + 63],
+    ],
+    ids=["rect", "corner", "scattered"],
+)
+def test_regenerate_only_changes_the_region(solved: list[int], cells: list[int]) -> None:
+    tiles = list(solved)
+    changed = regenerate(RULES, tiles, ROWS, COLS, cells, random.Random(1), grow=0)
+    assert changed == sorted(set(cells))
+    for i in range(ROWS * COLS):
+        if i not in changed:
+            assert tiles[i] == solved[i]
+    assert broken(tiles) == 0
+
+
+def test_components_split_far_apart_cells() -> None:
+    cols = 20
+    near = {0, 3}
+    far = {10 * cols + 10}
+    assert sorted(map(sorted, components(near | far, cols, 1))) == [[0, 3], [10 * cols + 10]]
+    # the last cell of a row and the first of the next are next to each other in index only
+    assert len(components({cols - 1, cols}, cols, 1)) == 2
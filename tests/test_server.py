@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+import asyncio
+import io
+
+from wave_function_collapse.server import feed_lines
+
+
+def test_feed_lines_reads_a_file_into_a_stream_reader() -> None:
+    # what serve_stdio falls back to when stdin is a regular file rather than a pipe
+    async def read() -> list[bytes]:
+        reader = asyncio.StreamReader()
+        feeding = asyncio.create_task(feed_lines(reader, io.BytesIO(b'{"id": 1}\n{"id": 2}\nlast')))
+        lines = [line async for line in reader]
+        await feeding
+        return lines
+
+    assert asyncio.run(read()) == [b'{"id": 1}\n', b'{"id": 2}\n', b"last"]
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from wave_function_collapse.entropy import Heuristic
+from wave_function_collapse.propagator import Contradiction
+from wave_function_collapse.rules import CompiledRules, compile_rules
+from wave_function_collapse.ruleset import builtin_rules
+from wave_function_collapse.simpler import CONNECTIONS, WEIGHTS, compile_connections
+from wave_function_collapse.solver import BacktrackLimits, Solver, SolverStats
+from wave_function_collapse.topology import grid, violations
+
+
+SIMPLER = compile_connections(CONNECTIONS, WEIGHTS)
+COAST = builtin_rules("coast")
+# three tiles that can't sit next to themselves, which keeps running into contradictions (and backtracking out of them)
+DIFFERENT = compile_rules(range(3), [1.0] * 3, [(a, b, d) for a in range(3) for b in range(3) for d in range(4) if a != b])
+
+
+def indices(solver: Solver) -> list[int]:
+    return [solver.wave.index(i) for i in range(solver.wave.size)]
+
+
+@pytest.mark.parametrize("rules", [SIMPLER, COAST], ids=["simpler", "coast"])
+@pytest.mark.parametrize("heuristic", list(Heuristic))
+def test_solved_maps_have_no_violations(rules: CompiledRules, heuristic: Heuristic) -> None:
+    solved = 0
+    for seed in range(8):
+        solver = Solver(rules, 24, 32, random.Random(seed), heuristic=heuristic)
+        if solver.run():
+            solved += 1
+            assert violations(solver.topology, rules.allowed, indices(solver)) == 0
+            assert -1 not in indices(solver)
+
+    assert solved > 0
+
+
+@pytest.mark.parametrize("rules", [SIMPLER, COAST, DIFFERENT], ids=["simpler", "coast", "different"])
+@pytest.mark.parametrize("periodic", [False, True])
+def test_backtracking_solves_without_violations(rules: CompiledRules, periodic: bool) -> None:
+    backtracks = 0
+    for seed in range(4):
+        topology = grid(24, 32, periodic)
+        solver = Solver(rules, 24, 32, random.Random(seed), BacktrackLimits(), topology=topology)
+        assert solver.run()
+        assert violations(topology, rules.allowed, indices(solver)) == 0
+        assert -1 not in indices(solver)
+        backtracks += solver.stats.backtracks
+
+    if rules is DIFFERENT:
+        assert backtracks > 0
+
+
+def test_backtracking_restarts_after_max_backtracks() -> None:
+    # maps that need many backtracks start over (with fresh random picks) instead of backtracking for good
+    limits = BacktrackLimits(max_backtracks=50)
+    attempts: list[SolverStats] = []
+    for seed in range(4):
+        solver = Solver(DIFFERENT, 30, 30, random.Random(seed), limits)
+        assert solver.run()
+        assert violations(solver.topology, DIFFERENT.allowed, indices(solver)) == 0
+        attempts.append(solver.stats)
+
+    assert sum(stats.restarts for stats in attempts) > 0
+    assert all(stats.backtracks <= limits.max_backtracks * (stats.restarts + 1) for stats in attempts)
+
+
+def test_run_finishes_once_restarts_run_out() -> None:
+    solver = Solver(DIFFERENT, 30, 30, random.Random(0), BacktrackLimits(max_restarts=0, max_backtracks=1))
+    assert not solver.run()
+    assert solver.contradiction is not None
+    assert solver.stats.restarts == 0 and solver.stats.backtracks <= 1
+
+
+def test_undo_restores_the_wave_exactly() -> None:
+    solver = Solver(COAST, 16, 16, random.Random(3), BacktrackLimits())
+    wave = solver.wave
+    for _ in range(10):
+        solver.collapse_next()
+
+    domains = list(wave.domains)
+    counts = wave.counts.tolist()
+    weight_sums = wave.weight_sums.tolist()
+    weight_log_sums = wave.weight_log_sums.tolist()
+    mark = wave.mark()
+
+    for _ in range(20):
+        i = solver.find_lowest_entropy()
+        assert i is not None
+        wave.collapse(i, wave.choose(i, solver.rng))
+        try:
+            solver.propagator.propagate([i])
+        except Contradiction:
+            break
+
+    assert wave.domains != domains
+    restored = wave.undo(mark)
+    assert restored
+    assert wave.mark() == mark
+    assert wave.domains == domains
+    assert wave.counts.tolist() == counts
+    assert wave.weight_sums.tolist() == weight_sums
+    assert wave.weight_log_sums.tolist() == weight_log_sums
+
+
+@pytest.mark.parametrize("rules", [COAST, DIFFERENT], ids=["coast", "different"])
+@pytest.mark.parametrize("limits", [BacktrackLimits(max_depth=8), BacktrackLimits(max_trail=200)], ids=["depth", "trail"])
+def test_forget_keeps_decisions_within_limits(rules: CompiledRules, limits: BacktrackLimits) -> None:
+    solver = Solver(rules, 24, 24, random.Random(1), limits)
+    while solver.collapse_next() is not None:
+        assert len(solver.decisions) <= limits.max_depth
+        assert solver.wave.trail is not None
+        if solver.decisions:
+            # nothing older than the oldest decision is kept, and the trail up to the newest one fits the limit
+            assert solver.wave.trail_base == solver.decisions[0].mark
+            assert solver.decisions[-1].mark - solver.wave.trail_base <= limits.max_trail
+
+    assert solver.contradiction is None
+    assert solver.stats.forgotten > 0
+    assert violations(solver.topology, rules.allowed, indices(solver)) == 0
+    if rules is DIFFERENT:
+        assert solver.stats.backtracks > 0
+
+
+def test_instrumented_solve_matches_a_plain_one() -> None:
+    from wave_function_collapse.instrument import instrument
+
+    plain = Solver(COAST, 24, 24, random.Random(2), BacktrackLimits())
+    plain.run()
+    solver = Solver(COAST, 24, 24, random.Random(2), BacktrackLimits())
+    instrumentation = instrument(solver)
+    banned: list[int] = []
+    instrumentation.on("ban", lambda i, domain: banned.append(i))
+    solver.run()
+
+    assert solver.tiles() == plain.tiles()
+    assert instrumentation.bans == len(banned) > 0
+    assert instrumentation.phases["propagate"].calls > 0
@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+from wave_function_collapse.tilemap import DirtyTiles
+from wave_function_collapse.wave import UNSET
+
+
+def test_only_cells_in_view_are_taken() -> None:
+    tilemap = DirtyTiles(10, 10)
+    tilemap.set_tile(0, 3)
+    tilemap.set_tile(55, 4)
+    # unchanged tiles aren't dirty
+    tilemap.set_tile(1, UNSET)
+    assert tilemap.dirty == {0, 55}
+
+    assert tilemap.take_dirty(0, 0, 2, 2) == [0]
+    # off-screen cells wait until they come into view
+    assert tilemap.dirty == {55}
+    assert tilemap.take_dirty(0, 0, 2, 2) == []
+    assert tilemap.take_dirty(5, 5, 9, 9) == [55]
+
+    tilemap.mark_dirty([0, 99])
+    assert sorted(tilemap.take_dirty(0, 0, 9, 9)) == [0, 99]
+    assert tilemap.tiles[0] == 3 and tilemap.tiles[55] == 4